@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+BENCH_IWORX compares the line-by-line parsing of IWORX
+data files with the block-wise parsing of read_iworx
+
+Use as: python benchmarks/bench_iworx.py [folder ...]
+where the folders default to the EMG_WI22 recordings
+
+Reports throughput in samples/s for both parsers
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from read_iworx import read_iworx
+
+
+def legacy_parse(datafile):
+    # the per-sample loop of the former read_iworx
+    trial, time = [[]], [[]]
+    with open(datafile) as f:
+        contents = f.readlines()
+        label = contents[0].rstrip().split('\t')
+        idx = [i for i, l in enumerate(label) if l.find('Time')]
+        trl, tmp = 0, []
+        for smp in range(1, len(contents)):
+            if contents[smp].split('\t')[0] == 'TimeOfDay':
+                trial[trl] = np.transpose(np.vstack(np.array(tmp)))
+                trl += 1
+                trial.append([])
+                time.append([])
+                tmp = []
+            else:
+                tmp.append([float(x) for i, x in enumerate(contents[smp].rstrip().split('\t')) if i in idx])
+                if contents[0].split('\t')[0] == 'TimeOfDay':
+                    h, m, s = contents[smp].split('\t')[contents[0].split('\t').index('TimeOfDay')].split(':')
+                    time[trl].append(float(h) * 3600 + float(m) * 60 + float(s))
+        trial[trl] = np.transpose(np.vstack(np.array(tmp)))
+    return trial, time
+
+
+def main(folders):
+    for folder in folders:
+        datafile = [l for l in glob.glob(folder + '/*.txt') if l.find('Marks') < 0][0]
+        t0 = time.perf_counter()
+        trial, _ = legacy_parse(datafile)
+        legacy = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        read_iworx(folder)
+        blockwise = time.perf_counter() - t0
+        nsmp = sum(t.shape[1] for t in trial)
+        print('%-40s %7d samples  legacy %9.0f samples/s  block-wise %9.0f samples/s  (%.1fx)' % (
+            os.path.basename(datafile), nsmp, nsmp / legacy, nsmp / blockwise, legacy / blockwise))
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join(here, '..', 'data', 'EMG_WI22', 'AM', '*'))))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+BENCH_PREFETCH simulates high-latency (network) storage by
+delaying every json open, and compares sequential reads
+with concurrent, prefetched reads in read_json_tcg
+
+Use as: python benchmarks/bench_prefetch.py [room folder] [--delay ms]
+where the room folder defaults to the first TCG_KU room
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import time
+import builtins
+import argparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', 'code'))
+from read_json_tcg import read_json_tcg
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('room', nargs='?', default=sorted(glob.glob(os.path.join(here, '..', 'data', 'TCG_KU', '*')))[0])
+    parser.add_argument('--delay', type=float, default=5, help='milliseconds per open')
+    args = parser.parse_args(argv)
+
+    # delay every json open
+    _open = builtins.open
+    def slow_open(file, *a, **kw):
+        if str(file).endswith('.json'):
+            time.sleep(args.delay / 1000)
+        return _open(file, *a, **kw)
+    builtins.open = slow_open
+
+    nfiles = len(glob.glob(os.path.join(args.room, '*.json')))
+    print('%s: %d files, %.1f ms per open' % (os.path.basename(args.room), nfiles, args.delay))
+    for prefetch in [0, 4, 16, 64]:
+        t0 = time.perf_counter()
+        read_json_tcg(args.room, prefetch=prefetch)
+        elapsed = time.perf_counter() - t0
+        print('prefetch=%-3d %8.3f s  %8.0f files/s' % (prefetch, elapsed, nfiles / elapsed))
+    builtins.open = _open
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+BENCH_RECORDS measures the per-record cost of the Python
+logic in read_json_tcg, i.e. the time of a full read minus
+the time of only decoding the same json files
+
+Use as: python benchmarks/bench_records.py [room folder] [--reader file.py]
+where the room folder defaults to the largest TCG_KU room and
+--reader points to another version of read_json_tcg.py, e.g.
+  git show HEAD~1:code/read_json_tcg.py > /tmp/read_json_tcg_old.py
+to compare before and after a change
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import importlib.util
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', 'code'))
+
+
+def load_reader(filename):
+    spec = importlib.util.spec_from_file_location('reader', filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.read_json_tcg
+
+
+def best_of(f, repeat):
+    times = []
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('room', nargs='?', default=None)
+    parser.add_argument('--reader', default=os.path.join(here, '..', 'code', 'read_json_tcg.py'))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    room = args.room
+    if room is None:
+        rooms = glob.glob(os.path.join(here, '..', 'data', 'TCG_KU', '*'))
+        room = max(rooms, key=lambda r: sum(os.path.getsize(f) for f in glob.glob(os.path.join(r, '*.json'))))
+    read_json_tcg = load_reader(args.reader)
+
+    files = sorted(glob.glob(os.path.join(room, '*.json')))
+    nrecords = sum(len(json.load(open(f))) for f in files)
+
+    def decode():
+        for f in files:
+            with open(f) as file:
+                json.load(file)
+
+    full = best_of(lambda: read_json_tcg(room), args.repeat)
+    decoding = best_of(decode, args.repeat)
+    print('%s (%s): %d records' % (os.path.basename(room), os.path.basename(args.reader), nrecords))
+    print('full read   %8.3f us/record' % (full / nrecords * 1e6))
+    print('decoding    %8.3f us/record' % (decoding / nrecords * 1e6))
+    print('logic       %8.3f us/record' % ((full - decoding) / nrecords * 1e6))
+
+
+if __name__ == '__main__':
+    main()
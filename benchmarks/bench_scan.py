@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+BENCH_SCAN compares the directory scans needed to locate
+the json files of a room, before and after indexing
+
+Use as: python benchmarks/bench_scan.py [cohort folder]
+where the cohort folder defaults to data/TCG_KU
+
+The legacy path issues one glob per session and one per
+trial and epoch, the indexed path one os.scandir per room
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import re
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from read_json_tcg import index_json_tcg
+
+
+def legacy_scan(logfile):
+    # the glob calls of the former read_json_tcg, without parsing
+    nscans = 0
+    for s in ['practice', 'training', 'game']:
+        list = glob.glob(logfile + os.path.sep + s + "*.json")
+        nscans += 1
+        ntrls = 0
+        for l in list:
+            dig = re.findall(r'\d+', l)
+            ntrls = max(ntrls, int(dig[len(dig)-1]))
+        for t in range(ntrls):
+            for e in ['roleassignment', 'tokenassignment', 'sender', 'receiver', 'feedback']:
+                glob.glob(logfile + os.path.sep + s + '_trial_' + str(t+1) + '_' + e + '*.json')
+                nscans += 1
+    return nscans
+
+
+def indexed_scan(logfile):
+    index_json_tcg(logfile)
+    return 1
+
+
+def main(folder):
+    rooms = sorted(glob.glob(os.path.join(folder, '*')))
+    for name, scan in [('legacy', legacy_scan), ('indexed', indexed_scan)]:
+        t0 = time.perf_counter()
+        nscans = sum(scan(r) for r in rooms)
+        elapsed = time.perf_counter() - t0
+        print('%-8s %4d rooms  %6d directory scans  %8.3f s' % (name, len(rooms), nscans, elapsed))
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    main(sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, '..', 'data', 'TCG_KU'))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+BENCH_STREAM compares read_json_tcg with whole-file json
+decoding against streamed, record-by-record decoding
+
+Use as: python benchmarks/bench_stream.py [room folder]
+where the room folder defaults to the TCG_KU room with
+the largest sender and receiver files
+
+Reports throughput (records/s) and the peak memory held
+while decoding a single json file
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import json
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from read_json_tcg import read_json_tcg, iter_json
+
+
+def largest_room(folder):
+    rooms = glob.glob(os.path.join(folder, '*'))
+    return max(rooms, key=lambda r: sum(os.path.getsize(f) for f in glob.glob(os.path.join(r, '*.json'))))
+
+
+def main(room):
+    files = sorted(glob.glob(os.path.join(room, '*.json')))
+    nrecords = sum(len(json.load(open(f))) for f in files)
+    largest = max(files, key=os.path.getsize)
+    print('%s: %d files, %d records, largest file %d kB' % (room, len(files), nrecords, os.path.getsize(largest) // 1000))
+
+    for stream in [False, True]:
+        # throughput of a full read
+        t0 = time.perf_counter()
+        read_json_tcg(room, stream=stream)
+        elapsed = time.perf_counter() - t0
+
+        # peak memory while walking the records of the largest file
+        tracemalloc.start()
+        with open(largest) as file:
+            for v in (iter_json(file) if stream else json.load(file)):
+                pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('stream=%-5s %10.0f records/s  %8.1f kB peak' % (stream, nrecords / elapsed, peak / 1000))
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    main(sys.argv[1] if len(sys.argv) > 1 else largest_room(os.path.join(here, '..', 'data', 'TCG_KU')))
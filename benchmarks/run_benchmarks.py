@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+RUN_BENCHMARKS times read_json_tcg and read_iworx on the
+bundled datasets and checks them against a stored baseline
+
+Use as: python benchmarks/run_benchmarks.py
+to compare with benchmarks/baseline.json, exiting with an error
+when a case is more than --threshold (default 25%) slower or
+uses that much more peak memory
+
+Use as: python benchmarks/run_benchmarks.py --save
+to (re)write the baseline, e.g. after a deliberate change or on
+a new machine, as timings depend on the hardware
+
+Cases
+tcg_room_cold   read_json_tcg on the largest TCG_KU room (full parse)
+tcg_room_warm   the same room from the parsed-room cache
+tcg_cohort      read_json_tcg_cohort on all TCG_KU rooms
+iworx_largest   read_iworx on the largest EMG_WI22 recording
+
+Reported per case: seconds (best of --repeat), throughput (files/s
+or samples/s) and peak memory (MB, tracemalloc, of a separate run)
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import tracemalloc
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', 'code'))
+from read_json_tcg import read_json_tcg, read_json_tcg_cohort
+from read_iworx import read_iworx
+
+data_dir = os.path.join(here, '..', 'data')
+
+
+def largest(paths, pattern):
+    return max(paths, key=lambda p: sum(os.path.getsize(f) for f in glob.glob(os.path.join(p, pattern))))
+
+
+def cases(workers):
+    # name: (setup, run, units of work, unit)
+    rooms = sorted(glob.glob(os.path.join(data_dir, 'TCG_KU', '*')))
+    room = largest(rooms, '*.json')
+    nroom = len(glob.glob(os.path.join(room, '*.json')))
+    ncohort = len(glob.glob(os.path.join(data_dir, 'TCG_KU', '*', '*.json')))
+    cache = tempfile.mkdtemp(prefix='tcg_cache_')
+    recording = largest(glob.glob(os.path.join(data_dir, 'EMG_WI22', '*', '*')), '*.txt')
+    nsmp = sum(t.shape[1] for t in read_iworx(recording)[0].trial)
+    return {
+        'tcg_room_cold': (None, lambda: read_json_tcg(room), nroom, 'files'),
+        'tcg_room_warm': (lambda: read_json_tcg(room, cache=cache), lambda: read_json_tcg(room, cache=cache), nroom, 'files'),
+        'tcg_cohort': (None, lambda: read_json_tcg_cohort(rooms, workers=workers), ncohort, 'files'),
+        'iworx_largest': (None, lambda: read_iworx(recording), nsmp, 'samples'),
+    }, cache
+
+
+def measure(setup, run, repeat):
+    if setup:
+        setup()
+    times = []
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baseline', default=os.path.join(here, 'baseline.json'))
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1, help='processes for the cohort case')
+    parser.add_argument('--only', nargs='+', help='cases to run')
+    args = parser.parse_args(argv)
+
+    todo, cache = cases(args.workers)
+    results = {}
+    try:
+        for name, (setup, run, n, unit) in todo.items():
+            if args.only and name not in args.only:
+                continue
+            seconds, peak = measure(setup, run, args.repeat)
+            results[name] = {'seconds': seconds, 'peak_mb': peak, unit + '_per_s': n / seconds}
+            print('%-14s %8.3f s  %12.0f %s/s  %8.1f MB peak' % (name, seconds, n / seconds, unit, peak))
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('baseline written to ' + args.baseline)
+        return 0
+
+    # compare against the baseline
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print('no baseline found, run with --save first')
+        return 0
+    failed = []
+    for name in results:
+        for metric in ['seconds', 'peak_mb']:
+            if name in baseline and results[name][metric] > baseline[name][metric] * (1 + args.threshold):
+                failed.append('%s %s: %.3f vs %.3f baseline' % (name, metric, results[name][metric], baseline[name][metric]))
+    for f in failed:
+        print('REGRESSION ' + f)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
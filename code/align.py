@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+ALIGN maps the epoch onsets of a communication game room (read_json_tcg)
+onto the samples of a physiological recording (read_iworx)
+
+INPUT
+Use as: clock = estimate_clock(tcg_times, iworx_times)
+where tcg_times are Unix timestamps (milliseconds) of marks on the game
+side, e.g. onsets(tcg)[:, 2] for the feedback onsets, and iworx_times
+are the seconds since midnight of the corresponding marks in the
+recording, e.g. np.array(event.sample)[mask]; the two lists need not
+pair up one to one, the clock offset is the one shared by most pairs
+of marks (within tolerance seconds), refined as the median over those
+pairs, with drift=True for a linear fit that also absorbs clock drift
+
+Without shared marks, clock = Clock(midnight(tcg_times)) assumes that
+both computers ran on the same (local) clock
+
+OUTPUT
+clock(tcg_times) gives the seconds since midnight on the recording's
+clock, where clock.offset is the recording's clock minus the game's
+(seconds), clock.drift the drift (seconds per second), and
+clock.matched the indices of the (tcg, iworx) mark pairs that were used
+
+Use as: block, sample = to_samples(data, clock(tcg_times))
+for the datablock and the nearest sample (within half a sample, or
+tolerance seconds) of each time, -1 if it falls outside the recording
+
+Use as: dat, t = tcg_epochs(data, tcg, clock, pre, post)
+to cut pre samples before to post samples after every sender, receiver
+and feedback onset of the game session (session=2) at once, into a
+trials x epochs x channels x (pre + post) samples array, NaN where an
+onset is missing or falls outside the recording, with t the trials x
+epochs onsets on the recording's clock
+--------------------------------------------------------
+"""
+
+
+import datetime
+import numpy as np
+
+from read_iworx import Event, epoch
+
+
+# epochs to cut, in order
+roles = ['sender', 'receiver', 'feedback']
+
+
+class Clock(object):
+    def __init__(self, midnight, offset=0., drift=0., origin=0.):
+        self.midnight = midnight  # Unix time (seconds) of the recording day's midnight
+        self.offset = offset
+        self.drift = drift
+        self.origin = origin      # seconds since midnight around which the drift is fitted
+        self.matched = np.zeros((0, 2), dtype=int)
+
+    def __call__(self, tcg_times):
+        t = np.asarray(tcg_times, dtype=float) / 1000 - self.midnight
+        return t + self.offset + self.drift * (t - self.origin)
+
+
+def midnight(tcg_times, tz=None):
+    # Unix time of midnight on the day of the first timestamp, local time
+    # (as data.info[1] of read_json_tcg) or tz hours from UTC
+    t = np.asarray(tcg_times, dtype=float).ravel()
+    t = t[~np.isnan(t)]
+    if not len(t):
+        return 0.
+    zone = None if tz is None else datetime.timezone(datetime.timedelta(hours=tz))
+    day = datetime.datetime.fromtimestamp(t[0] / 1000, zone)
+    return day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def estimate_clock(tcg_times, iworx_times, tolerance=.25, drift=False, tz=None):
+    clock = Clock(midnight(tcg_times, tz))
+    t = clock(tcg_times).ravel()
+    w = np.asarray(iworx_times, dtype=float).ravel()
+
+    # differences between all pairs of marks, within half a day
+    d = (w[None] - t[:, None] + 43200) % 86400 - 43200
+    pairs = np.argwhere(~np.isnan(d))
+    if not len(pairs):
+        print('a problem arose estimating the clock offset, no marks to compare')
+        return clock
+    d = d[pairs[:, 0], pairs[:, 1]]
+
+    # densest window of 2 x tolerance seconds
+    order = np.argsort(d)
+    ds = d[order]
+    count = np.searchsorted(ds, ds + 2 * tolerance, side='right') - np.arange(len(ds))
+    i = np.argmax(count)
+    inside = order[i:i+count[i]]
+
+    # one iworx mark per tcg mark, the closest to the window's median
+    centre = np.median(d[inside])
+    inside = inside[np.argsort(np.abs(d[inside] - centre))]
+    _, first = np.unique(pairs[inside, 0], return_index=True)
+    inside = inside[first]
+    _, first = np.unique(pairs[inside, 1], return_index=True)
+    inside = inside[first]
+    clock.matched = pairs[inside]
+    clock.offset = np.median(d[inside])
+    if drift and len(inside) > 2:
+        x, y = t[pairs[inside, 0]], t[pairs[inside, 0]] + d[inside]
+        clock.origin = np.mean(x)
+        slope, intercept = np.polyfit(x - clock.origin, y - x, 1)
+        clock.offset, clock.drift = intercept, slope
+    return clock
+
+
+def to_samples(data, times, tolerance=None):
+    # datablock and nearest sample of each time (seconds since midnight)
+    times = np.asarray(times, dtype=float)
+    block = np.full(times.shape, -1)
+    sample = np.full(times.shape, -1)
+    for b in range(len(data.time)):
+        time = np.asarray(data.time[b])
+        if len(time) < 2:
+            continue
+        tol = (time[1] - time[0]) / 2 if tolerance is None else tolerance
+        idx = np.clip(np.searchsorted(time, times), 1, len(time) - 1)
+        idx = np.where(times - time[idx-1] <= time[idx] - times, idx - 1, idx)
+        found = (np.abs(time[idx] - times) <= tol) & (block < 0)
+        block[found] = b
+        sample[found] = idx[found]
+    return block, sample
+
+
+def onsets(tcg, session=2, epochs=roles):
+    # trials x epochs onsets (Unix milliseconds), NaN where an epoch is missing
+    out = np.full((len(tcg.event[session]), len(epochs)), np.nan)
+    for t, (e, p) in enumerate(zip(tcg.event[session], tcg.epoch[session])):
+        for j, name in enumerate(epochs):
+            if name in p:
+                out[t, j] = e[p.index(name)]
+    return out
+
+
+def tcg_epochs(data, tcg, clock, pre, post, session=2, epochs=roles, tolerance=None):
+    # all onsets as events on the recording's clock, cut at once
+    t = clock(onsets(tcg, session, epochs))
+    event = Event()
+    event.sample = t.ravel()
+    dat = epoch(data, event, pre, post, tolerance=tolerance)
+    return dat.reshape(t.shape + dat.shape[1:]), t
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+EXPORT_TCG converts folders of communication game rooms
+into partitioned columnar (parquet) tables
+
+INPUT
+Use as: python export_tcg.py ../data tcg_parquet
+or:     export_tcg('../data', 'tcg_parquet', cohorts=['TCG_KU'])
+where '../data' contains cohort folders (TCG_WI22, TCG_WI24,
+TCG_KU, TCGK_WI24) of room folders read by read_json_tcg
+
+OUTPUT
+Three tables, with one parquet file per room, partitioned by cohort
+trials/cohort=TCG_KU/room000635.parquet
+          room, Session, and the variables of Data.label
+tokens/cohort=TCG_KU/room000635.parquet
+          room, Session, TrialNr, Role, xPos, yPos, angle (NaN for tcg
+          kids), timestamp, shape, control, action
+events/cohort=TCG_KU/room000635.parquet
+          room, Session, TrialNr, Epoch, timestamp
+
+Use as: python export_tcg.py ../data tcg_parquet --incremental
+to only parse rooms that are new or whose json files changed since
+the previous export (by modification time and size, then content
+hash), and to drop the files of rooms that no longer exist, as kept
+in tcg_parquet/manifest.json
+
+Read back with, e.g.,
+pd.read_parquet('tcg_parquet/trials', columns=['cohort', 'Level', 'SenderPlanTime'])
+
+Requires pyarrow
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from read_json_tcg import read_json_tcg_cohort
+
+
+sess = ['practice', 'training', 'game']
+tables = ['trials', 'tokens', 'events']
+
+
+def export_tcg(data_dir, out_dir, cohorts=None, workers=None, incremental=False):
+    if pa is None:
+        raise ImportError('export_tcg requires pyarrow')
+    if cohorts is None:
+        cohorts = sorted(c for c in os.listdir(data_dir) if c.startswith('TCG'))
+
+    # rooms exported before, with their json files
+    manifest = read_manifest(out_dir) if incremental else {}
+
+    for c in cohorts:
+        rooms = sorted(r for r in glob.glob(os.path.join(data_dir, c, '*')) if os.path.isdir(r))
+        previous = manifest.get(c, {})
+        current = {os.path.basename(r): room_manifest(r, previous.get(os.path.basename(r)), incremental) for r in rooms}
+
+        # drop the rows of deleted rooms
+        removed = set(previous) - set(current)
+        for name in removed:
+            remove_room(out_dir, c, name)
+
+        # parse new or changed rooms only
+        todo = [r for r in rooms if not incremental or
+                content(previous.get(os.path.basename(r))) != content(current[os.path.basename(r)])]
+        group_data, errors = read_json_tcg_cohort(todo, workers=workers, columnar=True, compact=True)
+        for room, data in zip(todo, group_data):
+            if data is not None:
+                write_room(out_dir, c, room, data)
+            else:  # retry on the next run
+                remove_room(out_dir, c, os.path.basename(room))
+                del current[os.path.basename(room)]
+        manifest[c] = current
+        print('%s: %d rooms exported, %d unchanged, %d removed, %d failed' % (
+            c, len(todo) - len(errors), len(rooms) - len(todo), len(removed), len(errors)))
+
+    write_manifest(out_dir, manifest)
+
+
+def room_manifest(room, previous=None, hash=True):
+    # modification time, size and content hash of every json file, reusing
+    # the hash of files whose modification time and size did not change
+    # (without hash, only the modification time and size, e.g. for a full
+    # export, which parses every room anyway)
+    files = {}
+    previous = previous['files'] if previous else {}
+    with os.scandir(room) as it:
+        for entry in it:
+            if not entry.name.endswith('.json'):
+                continue
+            st = entry.stat()
+            stamp = [st.st_mtime_ns, st.st_size]
+            if entry.name in previous and previous[entry.name][:2] == stamp:
+                files[entry.name] = previous[entry.name]
+            elif not hash:
+                files[entry.name] = stamp
+            else:
+                with open(entry.path, 'rb') as f:
+                    files[entry.name] = stamp + [hashlib.sha1(f.read()).hexdigest()]
+    return {'files': files}
+
+
+def content(entry):
+    # file names and content hashes of a room (modification time and size
+    # for files that were not hashed)
+    return {name: f[2] if len(f) > 2 else f[:2] for name, f in entry['files'].items()} if entry else None
+
+
+def read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(out_dir, manifest):
+    os.makedirs(out_dir, exist_ok=True)
+    filename = os.path.join(out_dir, 'manifest.json')
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def write_room(out_dir, cohort, room, data):
+    # one parquet file per table
+    name = os.path.basename(room)
+    for table, values in zip(tables, room_tables(name, data)):
+        folder = os.path.join(out_dir, table, 'cohort=' + cohort)
+        os.makedirs(folder, exist_ok=True)
+        pq.write_table(values, os.path.join(folder, name + '.parquet'))
+
+
+def remove_room(out_dir, cohort, name):
+    for table in tables:
+        filename = os.path.join(out_dir, table, 'cohort=' + cohort, name + '.parquet')
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def room_tables(name, data):
+    # trials, tokens and events of a room read with columnar=True, compact=True
+    trials, tokens, events = [], [], []
+    for sidx, s in enumerate(sess):
+        # trials
+        t = pa.table({l: data.trial[sidx][l] for l in data.label})
+        t = t.add_column(0, 'Session', pa.array([s] * len(t), pa.string()))
+        trials.append(t.add_column(0, 'room', pa.array([name] * len(t), pa.string())))
+
+        # token trajectories
+        for role, traj in [('sender', data.token_sender[sidx]), ('receiver', data.token_receiver[sidx])]:
+            n = len(traj.time)
+            tokens.append(pa.table({
+                'room': pa.array([name] * n, pa.string()),
+                'Session': pa.array([s] * n, pa.string()),
+                'TrialNr': np.repeat(np.arange(1, len(traj) + 1, dtype=np.int16), np.diff(traj.offset)),
+                'Role': pa.array([role] * n, pa.string()),
+                'xPos': traj.coord[:, 0].astype(np.float64),
+                'yPos': traj.coord[:, 1].astype(np.float64),
+                'angle': np.where(traj.ncoord == 3, traj.coord[:, 2], np.nan),
+                'timestamp': traj.time,
+                'shape': dictionary(traj.shape, [str(v) for v in traj.shapes]),
+                'control': dictionary(traj.control, [v if isinstance(v, str) else json.dumps(v) for v in traj.controls]),
+                'action': dictionary(traj.action, traj.actions)}))
+
+        # epoch onsets
+        rows = {'room': [], 'Session': [], 'TrialNr': [], 'Epoch': [], 'timestamp': []}
+        for tidx in range(len(data.event[sidx])):
+            for e, onset in zip(data.epoch[sidx][tidx], data.event[sidx][tidx]):
+                rows['room'].append(name)
+                rows['Session'].append(s)
+                rows['TrialNr'].append(tidx+1)
+                rows['Epoch'].append(e)
+                rows['timestamp'].append(onset)
+        events.append(pa.table({'room': pa.array(rows['room'], pa.string()),
+                                'Session': pa.array(rows['Session'], pa.string()),
+                                'TrialNr': pa.array(rows['TrialNr'], pa.int16()),
+                                'Epoch': pa.array(rows['Epoch'], pa.string()),
+                                'timestamp': pa.array(rows['timestamp'], pa.int64())}))
+    return [pa.concat_tables(trials), pa.concat_tables(tokens), pa.concat_tables(events)]
+
+
+def dictionary(codes, values):
+    # small-int codes of a Trajectory as a categorical column
+    return pa.DictionaryArray.from_arrays(codes, pa.array(values, pa.string()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert TCG room folders into partitioned parquet tables')
+    parser.add_argument('data_dir', help='folder containing the cohort folders')
+    parser.add_argument('out_dir', help='folder for the trials, tokens and events tables')
+    parser.add_argument('--cohorts', nargs='+', help='cohort folders to convert (default: all TCG*)')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--incremental', action='store_true', help='only parse new or changed rooms, and drop deleted rooms')
+    args = parser.parse_args(argv)
+    export_tcg(args.data_dir, args.out_dir, args.cohorts, args.workers, args.incremental)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
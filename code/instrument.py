@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+INSTRUMENT collects per-phase timers and counters of the
+readers (read_json_tcg, read_iworx)
+
+Use as: data = read_json_tcg('room001225', profile=True)
+        data, event = read_iworx(folder, profile=True)
+to get a report in data.profile, a dict with
+reader    'read_json_tcg' or 'read_iworx'
+source    the room or recording folder
+total     seconds from start to end of the read
+timers    seconds per phase, e.g. 'scan', 'decode', 'epoch sender'
+counters  e.g. 'scans', 'files', 'bytes', 'records', 'cache hits'
+
+Use as: data = read_json_tcg('room001225', profile=sink)
+to also hand the report to sink(report), e.g. print_report or a
+jsonl_sink('profile.jsonl'), which should be a module-level
+function when rooms are read in parallel processes
+
+Use as: READ_PROFILE=1 python script.py
+to profile all reads without changing the code, printing the reports
+to stderr, or READ_PROFILE=profile.jsonl to append them to a file, where
+profile=False keeps a read unprofiled regardless
+
+When profiling is off (the default) the readers get the no-op report
+off, whose timers and counters do nothing, such that the bookkeeping
+costs no more than a call per file
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import json
+import time
+import contextlib
+import collections
+
+
+class Report(object):
+    # timers and counters of a single read
+    def __init__(self, reader, source, sink=None):
+        self.reader = reader
+        self.source = source
+        self.sink = sink
+        self.timers = collections.defaultdict(float)
+        self.counters = collections.defaultdict(int)
+        self.start = time.perf_counter()
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add(self, name, seconds):
+        self.timers[name] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        # with report.timer('scan'): adds the seconds spent in the block
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - tic
+
+    def file(self, filename):
+        # count a file and its bytes
+        self.counters['files'] += 1
+        self.counters['bytes'] += os.path.getsize(filename)
+
+    def counted(self, values, name='records'):
+        # pass values through, counting them
+        for v in values:
+            self.counters[name] += 1
+            yield v
+
+    def finish(self, data):
+        # attach the report to the data, and emit it
+        data.profile = {'reader': self.reader, 'source': self.source,
+                        'total': time.perf_counter() - self.start,
+                        'timers': dict(self.timers), 'counters': dict(self.counters)}
+        if self.sink:
+            self.sink(data.profile)
+        return data.profile
+
+
+class Off(object):
+    # the report when profiling is off, which is false and does nothing
+    def __bool__(self):
+        return False
+
+    def count(self, name, n=1):
+        pass
+
+    def add(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return nothing
+
+    def file(self, filename):
+        pass
+
+    def counted(self, values, name='records'):
+        return values
+
+    def finish(self, data):
+        return None
+
+
+nothing = contextlib.nullcontext()
+off = Off()
+
+
+def start(reader, source, profile=None):
+    # a Report when profiling is switched on by the argument (True, a sink
+    # or a READ_PROFILE value) or, when it is None, by the READ_PROFILE
+    # environment variable, otherwise off
+    if profile is False:
+        return off
+    if profile is None:
+        profile = os.environ.get('READ_PROFILE')
+        if not profile or profile == '0':
+            return off
+    if profile is True:
+        sink = None
+    elif callable(profile):
+        sink = profile
+    elif profile in ('1', 'stderr'):
+        sink = print_report
+    else:  # a file name
+        sink = jsonl_sink(profile)
+    return Report(reader, source, sink)
+
+
+def print_report(report, file=None):
+    file = file or sys.stderr
+    print('%s %s: %.3f s' % (report['reader'], report['source'], report['total']), file=file)
+    for name, seconds in sorted(report['timers'].items(), key=lambda x: -x[1]):
+        print('  %-24s %9.4f s' % (name, seconds), file=file)
+    for name, n in sorted(report['counters'].items()):
+        print('  %-24s %9d' % (name, n), file=file)
+
+
+class jsonl_sink(object):
+    # appends each report as a line of json
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __call__(self, report):
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(report) + '\n')
@@ -9,9 +9,18 @@
     data, event = read_iworx(folder)
   where folder contains a data (.txt) and marks (.txt) file
 
+  Use as
+    data, event = read_iworx(folder, sidecar=True)
+  to also store the data in a binary sidecar next to the data file
+  (.iwx.npy, channels x samples, and .iwx.json, labels, blocks, start
+  times and events), which later reads memory-map instead of parsing
+  the text, for as long as the data and marks files are unchanged; the
+  sidecar is only written after a read without problems, and a folder
+  that cannot be written to leaves the read as without sidecar
+
   data has the following nested fields:
-    .trial
-    .time
+    .trial    channels x samples, per datablock
+    .time     seconds since midnight, per datablock
     .label
 
   event has the following nested fields:
@@ -19,84 +28,306 @@
     .sample
     .value
 
+  Use as
+    data, event = read_iworx(folder, lazy=True)
+  to read through the sidecar only, where data is a Recording whose
+  .trial and .time are memory-mapped views, data.select(channels,
+  begin, end) reads only the requested channels and time range,
+  data.chunks(channels, size) iterates the datablocks back to back in
+  fixed-size chunks, and data.stats(channels) returns the mean,
+  variance and correlation matrix computed in one streaming pass
+
+  Use as
+    data, event = read_iworx(folder, profile=True)
+  to time the phases of the read (scan, sidecar, marks, reading and
+  parsing the data) and count the files, bytes, samples and events,
+  reported in data.profile (see instrument.py)
+
+  Use as
+    dat = epoch(data, event, pre, post, selector)
+  to cut the data around events, e.g. selector=lambda v: v[0] == '+',
+  into an events x channels x (pre + post) samples array, matching
+  event times to the nearest sample of data.time (within half a
+  sample, or tolerance seconds)
+
   Copyright (C) 2022, Arjen Stolk
   --------------------------------------------------------
 """
 
 
+import os
 import glob
+import io
+import json
 import numpy as np
 
+import instrument
+
+
+class Event(object):
+    def __init__(self):
+        self.type = []
+        self.sample = []
+        self.value = []
+
+
+class Data(object):
+    def __init__(self):
+        self.trial = []
+        self.time = []
+        self.label = []
+
+
+class Recording(Data):
+    # memory-mapped recording (see load_sidecar), where data.trial and
+    # data.time are views and samples are only read once touched
+    def __init__(self, values, label, offset, has_time):
+        Data.__init__(self)
+        self.values = values  # channels (+ time) x samples, all datablocks
+        self.offset = offset  # first sample of each datablock
+        self.label = label
+        nchan = len(label)
+        for b in range(len(offset) - 1):
+            self.trial.append(values[:nchan, offset[b]:offset[b+1]])
+            self.time.append(values[nchan, offset[b]:offset[b+1]] if has_time else np.empty(0))
+
+    def rows(self, channels):
+        # channel labels to rows, as a slice where possible
+        if channels is None:
+            return slice(0, len(self.label))
+        if isinstance(channels, str):
+            channels = [channels]
+        rows = [self.label.index(c) for c in channels]
+        if rows == list(range(rows[0], rows[-1] + 1)):
+            return slice(rows[0], rows[-1] + 1)
+        return rows
+
+    def select(self, channels=None, begin=None, end=None):
+        # trial and time of the requested channels between begin and end (seconds)
+        rows = self.rows(channels)
+        trial, time = [], []
+        for b in range(len(self.trial)):
+            t = self.time[b]
+            if (begin is not None or end is not None) and not len(t):
+                raise ValueError('no TimeOfDay information to select a time range')
+            lo = 0 if begin is None else np.searchsorted(t, begin)
+            hi = len(self.trial[b][0]) if end is None else np.searchsorted(t, end, side='right')
+            if hi > lo:
+                trial.append(self.values[rows, self.offset[b]+lo:self.offset[b]+hi])
+                time.append(t[lo:hi])
+        return trial, time
+
+    def chunks(self, channels=None, size=100000):
+        # the datablocks back to back, size samples at a time
+        rows = self.rows(channels)
+        for i in range(0, self.offset[-1], size):
+            yield np.array(self.values[rows, i:i+size])
+
+    def stats(self, channels=None, size=100000):
+        # mean, variance and correlation matrix in one pass over the chunks
+        n, mean, C = 0, 0, 0
+        for x in self.chunks(channels, size):
+            m = x.shape[1]
+            xm = x.mean(axis=1)
+            xc = x - xm[:, None]
+            delta = xm - mean
+            mean = mean + delta * m / (n + m)
+            C = C + xc @ xc.T + np.outer(delta, delta) * n * m / (n + m)
+            n += m
+        var = np.diag(C) / n
+        return mean, var, C / np.sqrt(np.outer(np.diag(C), np.diag(C)))
+
+
+def read_iworx(folder, sidecar=False, lazy=False, profile=None):
+    # timers and counters, which do nothing when not profiling
+    report = instrument.start('read_iworx', folder, profile)
 
-def read_iworx(folder):
     # check the input
-    txtfiles = glob.glob(folder + '/*.txt')
+    with report.timer('scan'):
+        txtfiles = glob.glob(folder + '/*.txt')
+    report.count('scans')
+    markfile, datafile = None, None
     for l in txtfiles:
         if l.find('Marks') > 0:
             markfile = l
         else:
             datafile = l
 
+    # memory-mapped copy of a previous read
+    sidecar = sidecar or lazy
+    if sidecar and datafile:
+        try:
+            with report.timer('sidecar load'):
+                data, event = load_sidecar(datafile, markfile)
+            report.count('sidecar hits')
+            report.count('events', len(event.sample))
+            report.finish(data)
+            return data, event
+        except (OSError, ValueError, KeyError):
+            pass  # missing or outdated
+
     # read the marks file
-    class Event(object):
-        def __init__(self):
-            self.type = []
-            self.sample = []
-            self.value = []
     event = Event()
-    try:
-        with open(markfile) as f:
-            contents = f.readlines()
-            for e in range(1, len(contents)):
-                event.type.append('trig')
-                h, m, s = contents[e].split("	")[contents[0].split(
-                    '\t').index('Real Time')].split(':')
-                event.sample.append(float(h) * 3600 + float(m) * 60 + float(s))
-                event.value.append(contents[e].split(
-                    "	")[contents[0].split('\t').index('MarkValue')])
-    except:
-        print('a problem arose extracting the events')
+    complete = False  # whether the marks and data were parsed without problems
+    with report.timer('marks'):
+        try:
+            if markfile:  # without a marks file, there are no events
+                with open(markfile) as f:
+                    contents = f.readlines()
+                    report.file(markfile)
+                    rt = contents[0].split('\t').index('Real Time')
+                    mv = contents[0].split('\t').index('MarkValue')
+                    for e in range(1, len(contents)):
+                        fields = contents[e].split('\t')
+                        event.type.append('trig')
+                        h, m, s = fields[rt].split(':')
+                        event.sample.append(float(h) * 3600 + float(m) * 60 + float(s))
+                        event.value.append(fields[mv])
+            complete = True
+        except:
+            print('a problem arose extracting the events')
+    report.count('events', len(event.sample))
 
     # read the data file
-    class Data(object):
-        def __init__(self):
-            self.trial = []
-            self.time = []
-            self.label = []
     data = Data()
     try:
-        with open(datafile) as f:
-            contents = f.readlines()
-            # header
-            data.label = contents[0].rstrip().split('\t')
-            idx = []
-            for i, l in enumerate(data.label):
-                if l.find('Time'):
-                    idx.append(i)
-            data.label = [data.label[i] for i in idx]
-
-            # data
-            trl = 0
-            data.trial.append([])
-            data.time.append([])
-            tmp = []
-            for smp in range(1, len(contents)):
-                if contents[smp].split('\t')[0] == 'TimeOfDay': # mark a new datablock/trial
-                    data.trial[trl] = np.transpose(np.vstack(np.array(tmp)))
-                    trl += 1
-                    data.trial.append([])
-                    data.time.append([])
-                    tmp = []
-                else: # read the data line by line
-                    tmp.append([float(x) for i, x in enumerate(
-                        contents[smp].rstrip().split('\t')) if i in idx])
-                    if contents[0].split('\t')[0] == 'TimeOfDay': # if possible, add time information from TimeOfDay timestamps
-                        h, m, s = contents[smp].split(
-                            "	")[contents[0].split('\t').index('TimeOfDay')].split(':')
-                        data.time[trl].append(
-                            float(h) * 3600 + float(m) * 60 + float(s))
-            data.trial[trl] = np.transpose(np.vstack(np.array(tmp)))
+        with report.timer('data read'):
+            with open(datafile) as f:
+                header = f.readline().rstrip().split('\t')
+                contents = f.read()
+        report.file(datafile)
+
+        # channels (excluding the time columns)
+        idx = [i for i, l in enumerate(header) if not l.startswith('Time')]
+        data.label = [header[i] for i in idx]
+
+        # data, one block per 'TimeOfDay' marker (new datablock/trial)
+        blocks = contents.split('\nTimeOfDay\t')
+        for b, block in enumerate(blocks):
+            if b > 0:  # skip the remainder of the block's header line
+                block = block.partition('\n')[2]
+            with report.timer('data parse'):
+                values = np.loadtxt(io.StringIO(block), delimiter='\t', usecols=idx, ndmin=2)
+                data.trial.append(values.T.copy())
+                data.time.append(np.empty(0))
+            report.count('blocks')
+            report.count('samples', len(values))
+            if header[0] == 'TimeOfDay':  # if possible, add time information from TimeOfDay timestamps
+                with report.timer('clock parse'):
+                    data.time[b] = read_clock(block, len(values))
     except:
         print('a problem arose reading the data')
+        complete = False
+
+    # binary copy for later reads
+    if sidecar and complete and data.trial:
+        with report.timer('sidecar save'):
+            try:
+                save_sidecar(datafile, markfile, data, event)
+            except OSError:  # e.g. a read-only folder
+                print('a problem arose writing the sidecar of ' + datafile)
+                complete = False
+        if lazy and complete:
+            data, event = load_sidecar(datafile, markfile)
+    report.finish(data)
+    return data, event
+
+
+def epoch(data, event, pre, post, selector=None, tolerance=None):
+    # events x channels x samples, from pre samples before to post samples
+    # after each selected event (NaN beyond the edges of its datablock, or
+    # for events that fall outside all datablocks)
+    sample = np.asarray(event.sample, dtype=float)
+    if selector is None:
+        sel = np.arange(len(sample))
+    elif callable(selector):  # e.g. lambda value: value[0] == '+'
+        sel = np.array([i for i, v in enumerate(event.value) if selector(v)], dtype=int)
+    else:  # indices or boolean mask
+        sel = np.arange(len(sample))[selector]
+    sample = sample[sel]
+
+    nchan = len(data.label)
+    dat = np.full((len(sample), nchan, pre + post), np.nan)
+    for b in range(len(data.trial)):
+        time = np.asarray(data.time[b])
+        if len(time) < 2:
+            continue
+        tol = (time[1] - time[0]) / 2 if tolerance is None else tolerance
 
+        # nearest sample of each event, within tolerance
+        idx = np.clip(np.searchsorted(time, sample), 1, len(time) - 1)
+        idx = np.where(sample - time[idx-1] <= time[idx] - sample, idx - 1, idx)
+        found = np.abs(time[idx] - sample) <= tol
+        if not found.any():
+            continue
+
+        # cut all windows at once
+        win = idx[found, None] + np.arange(-pre, post)
+        inside = (win >= 0) & (win < len(time))
+        cut = np.asarray(data.trial[b])[:, np.clip(win, 0, len(time) - 1)]  # channels x events x samples
+        cut = np.where(inside[None], cut, np.nan)
+        dat[found] = np.transpose(cut, (1, 0, 2))
+    return dat
+
+
+def sidecar_stamp(filename):
+    # modification time and size of the source files
+    if filename is None:
+        return None
+    st = os.stat(filename)
+    return [os.path.basename(filename), st.st_mtime_ns, st.st_size]
+
+
+def save_sidecar(datafile, markfile, data, event):
+    # channel-major array (channels, plus time if available, x samples)
+    # and a json header, next to the data file
+    stem = os.path.splitext(datafile)[0]
+    values = np.hstack(data.trial)
+    if all(len(t) for t in data.time):
+        values = np.vstack([values, np.hstack(data.time)])
+    header = {'label': data.label,
+              'offset': np.cumsum([0] + [t.shape[1] for t in data.trial]).tolist(),
+              'start': [t[0] if len(t) else None for t in data.time],
+              'time': len(values) > len(data.label),
+              'event': {'type': event.type, 'sample': event.sample, 'value': event.value},
+              'source': [sidecar_stamp(datafile), sidecar_stamp(markfile)]}
+    np.save(stem + '.iwx.npy', values)
+    with open(stem + '.iwx.json', 'w') as f:  # written last, marking the sidecar complete
+        json.dump(header, f)
+
+
+def load_sidecar(datafile, markfile):
+    stem = os.path.splitext(datafile)[0]
+    with open(stem + '.iwx.json') as f:
+        header = json.load(f)
+    if header['source'] != [sidecar_stamp(datafile), sidecar_stamp(markfile)]:
+        raise ValueError('sidecar is outdated')
+    values = np.load(stem + '.iwx.npy', mmap_mode='r')
+
+    # views into the memory map, one per datablock/trial
+    data, event = Recording(values, header['label'], header['offset'], header['time']), Event()
+    event.type = header['event']['type']
+    event.sample = header['event']['sample']
+    event.value = header['event']['value']
     return data, event
+
+
+def read_clock(block, nsmp):
+    # HH:MM:SS.fff at the start of each line, in seconds
+    a = np.frombuffer(block.encode(), dtype=np.uint8)
+    starts = np.flatnonzero(a == 10) + 1
+    starts = np.r_[0, starts[starts < len(a)]]
+    starts = starts[a[starts] != 10]  # skip empty lines
+    if len(starts) == nsmp and nsmp and starts[-1] + 13 <= len(a):
+        c = a[starts[:, None] + np.arange(13)]
+        if np.all(c[:, [2, 5, 8, 12]] == np.frombuffer(b'::.\t', dtype=np.uint8)):
+            d = c[:, [0, 1, 3, 4, 6, 7, 9, 10, 11]].astype(np.int32) - 48
+            h = d[:, 0] * 10 + d[:, 1]
+            m = d[:, 2] * 10 + d[:, 3]
+            ms = d[:, 4] * 10000 + d[:, 5] * 1000 + d[:, 6] * 100 + d[:, 7] * 10 + d[:, 8]
+            return h * 3600. + m * 60. + ms / 1000
+    # other formats, e.g. without leading zeros or milliseconds
+    clock = np.loadtxt(io.StringIO(block), delimiter='\t', usecols=[0], dtype=str, ndmin=1)
+    hms = np.char.partition(clock, ':')
+    ms = np.char.partition(hms[:, 2], ':')
+    return hms[:, 0].astype(float) * 3600 + ms[:, 0].astype(float) * 60 + ms[:, 2].astype(float)
@@ -9,6 +9,42 @@ INPUT
 Use as: data = read_json_tcg('room001225')
 where 'roomxxx' is a folder containing the '*.json' files
 
+Use as: data = read_json_tcg('room001225', cache='tcg_cache')
+to keep a parsed copy of the room in the 'tcg_cache' folder, which is
+reused as long as none of the room's json files (nor this reader)
+have changed, and evicted (least recently used first) once the folder exceeds
+cache_size megabytes
+
+Use as: data = read_json_tcg('room001225', columnar=True)
+to store the trials of each session as a numpy structured array with
+one typed column per label (NaN for missing values), such that
+pd.DataFrame(data.trial[2]) and np.concatenate across rooms are direct
+
+Use as: data = read_json_tcg('room001225', compact=True)
+to store the token positions of each session in a Trajectory, backed
+by parallel arrays (coordinates, timestamps and small-int codes for
+shape, control and action) with per-trial offsets and one target per
+trial; data.token_sender[s][t] still returns the list form below
+
+Use as: data = read_json_tcg('room001225', stream=True)
+to decode the records of each json file one at a time (with ijson, if
+installed), such that memory is bounded by a record instead of a file
+
+Use as: data = read_json_tcg('room001225', prefetch=16)
+to read the json files with up to 16 concurrent reads (threads),
+consumed in trial order, for rooms on high-latency (network) storage
+
+Use as: data = read_json_tcg('room001225', profile=True)
+to time the phases of the read (directory scan, json decoding, each
+epoch's reader, columnar/compact conversion) and count the scans,
+files, bytes and records, reported in data.profile (see instrument.py,
+also for the READ_PROFILE environment variable and report sinks)
+
+Use as: data, errors = read_json_tcg_cohort(rooms, workers=4)
+where 'rooms' is a list of room folders (or a folder containing them)
+that are read in parallel, one room per process, and any of the above
+options are passed on to read_json_tcg
+
 OUTPUT
 A struct containing;
 info      recording file, date and onset, and game type
@@ -27,7 +63,19 @@ import datetime
 import glob
 import re
 import json
+import hashlib
+import pickle
+import io
+import itertools
+import collections
+import concurrent.futures
 import numpy as np
+try:
+    import ijson  # optional, incremental json parser
+except ImportError:
+    ijson = None
+
+import instrument
 
 
 class Data(object):
@@ -42,268 +90,540 @@ class Data(object):
                       'ReceiverPlayer', 'ReceiverPlanTime', 'ReceiverMovTime', 'ReceiverNumMoves',
                       'Success', 'SenderLocSuccess', 'SenderOriSuccess', 'ReceiverLocSuccess', 'ReceiverOriSuccess',
                       'Level', 'TrialOffset', 'Addressee']
+        # column types when stored as a structured array (columnar=True)
+        self.dtype = [('TrialNr', 'i2'), ('TrialType', 'i1'), ('TrialTypeNr', 'f4'), ('TrialOnset', 'f8'),
+                      ('SenderPlayer', 'f4'), ('SenderPlanTime', 'f8'), ('SenderMovTime', 'f8'), ('SenderNumMoves', 'i4'),
+                      ('TargetNum', 'i4'), ('TargetTime', 'f8'), ('NonTargetTime', 'f8'),
+                      ('ReceiverPlayer', 'f4'), ('ReceiverPlanTime', 'f8'), ('ReceiverMovTime', 'f8'), ('ReceiverNumMoves', 'i4'),
+                      ('Success', 'f4'), ('SenderLocSuccess', 'f4'), ('SenderOriSuccess', 'f4'), ('ReceiverLocSuccess', 'f4'), ('ReceiverOriSuccess', 'f4'),
+                      ('Level', 'f4'), ('TrialOffset', 'f8'), ('Addressee', 'f4')]
         self.event = []  # onset timestamps of the five epochs
+        self.epoch = []  # epoch names of these onsets
         # coord [xPos, yPos, angle], time, shape, control, action, target [xPos, yPos, angle]
         self.token_sender = []
         self.token_receiver = []
+        # per token row, (time of the json record before it (-1 if none), goal
+        # number of the token (tcg kids, 0 otherwise)), only collected with
+        # compact=True and then held by the Trajectory
+        self.token_sender_meta = None
+        self.token_receiver_meta = None
+
+
+class Trajectory(object):
+    # token trajectories of one session as parallel arrays, with the rows of
+    # trial t at offset[t]:offset[t+1] (compact=True), and the per-row meta
+    # (data.token_sender_meta) as prev_time and goal
+    def __init__(self, trials, meta=None):
+        rows = [row for trial in trials for row in trial]
+        self.offset = np.cumsum([0] + [len(trial) for trial in trials])
+        self.ncoord = np.array([len(row[0]) for row in rows], dtype=np.int8)
+        coord = [row[0] + [0] * (3 - len(row[0])) for row in rows]
+        if all(isinstance(x, int) for c in coord for x in c):
+            self.coord = np.array(coord, dtype=np.int16).reshape(-1, 3)
+        else:  # mouse/touch positions
+            self.coord = np.array(coord, dtype=np.float64).reshape(-1, 3)
+        self.time = np.array([row[1] for row in rows], dtype=np.int64)
+        # small-int codes into the lists of distinct values
+        self.shapes, self.shape = self.encode([row[2] for row in rows])
+        self.controls, self.control = self.encode([row[3] for row in rows])
+        self.actions, self.action = self.encode([row[4] for row in rows])
+        # target, once per trial
+        self.target = [trial[0][5] if trial else np.nan for trial in trials]
+        # time of the record before each row, and the token's goal number (tcg kids)
+        meta = [m for trial in meta for m in trial] if meta is not None else [[-1, 0]] * len(rows)
+        self.prev_time = np.array([m[0] for m in meta], dtype=np.int64)
+        self.goal = np.array([m[1] for m in meta], dtype=np.int16)
+
+    @staticmethod
+    def encode(values):
+        table, codes, index = [], [], {}
+        for v in values:
+            key = json.dumps(v)
+            if key not in index:
+                index[key] = len(table)
+                table.append(v)
+            codes.append(index[key])
+        return table, np.array(codes, dtype=np.int8)
 
+    def __len__(self):
+        return len(self.offset) - 1
+
+    def __getitem__(self, t):
+        # rows of trial t in the list form [coord, time, shape, control, action, target]
+        t = range(len(self))[t]
+        rows = []
+        for i in range(self.offset[t], self.offset[t+1]):
+            rows.append([self.coord[i, :self.ncoord[i]].tolist(), int(self.time[i]),
+                         self.shapes[self.shape[i]], self.controls[self.control[i]],
+                         self.actions[self.action[i]], self.target[t]])
+        return rows
+
+    def __iter__(self):
+        for t in range(len(self)):
+            yield self[t]
+
+
+def read_json_tcg(logfile, cache=None, cache_size=1000, columnar=False, compact=False, stream=False, prefetch=0,
+                  profile=None):
+    # timers and counters, which do nothing when not profiling
+    report = instrument.start('read_json_tcg', logfile, profile)
+
+    # index all json files in a single directory scan
+    with report.timer('scan'):
+        files = index_json_tcg(logfile)
+    report.count('scans')
+
+    # previously parsed copy of the same files
+    if cache:
+        with report.timer('cache load'):
+            key = cache_key(logfile, files, columnar, compact)
+            data = load_cache(cache, key)
+        if data is not None:
+            report.count('cache hits')
+            report.finish(data)
+            return data
 
-def read_json_tcg(logfile):
     # recording information
     data = Data()
     data.info[0] = logfile
     data.info[1] = datetime.datetime.fromtimestamp(
         os.stat(logfile).st_mtime).strftime('%Y-%m-%d-%H:%M')
+    if compact:
+        collect_meta(data)
 
-    # read all json files
-    sess = ['practice', 'training', 'game']
-    epoch = ['roleassignment', 'tokenassignment',
-             'sender', 'receiver', 'feedback']
-    for sidx, s in enumerate(sess):
-        data.trial.append([])  # multiple trials per session
-        data.event.append([])
-        data.token_sender.append([])
-        data.token_receiver.append([])
-
-        # number of trials for this session
-        list = glob.glob(logfile + os.path.sep + s + "*.json")
-        ntrls = 0
-        for l in list:
-            dig = re.findall(r'\d+', l)
-            trl = int(dig[len(dig)-1])
-            if trl > ntrls:
-                ntrls = trl
+    # read all json files, per session and trial
+    sessions = [session_files(files, s) for s in sess]
+    if prefetch:  # concurrent reads, consumed in the same order
+        contents = prefetch_json([f for trials in sessions for trial in trials for e, f in trial], prefetch)
+    trl = {}  # trial variables, and movement onsets carried over between trials
+    for sidx, trials in enumerate(sessions):
+        new_session(data)
 
         # trial loop
-        for t in range(ntrls):
-            data.event[sidx].append([])  # multiple events/locations per trial
-            data.token_sender[sidx].append([])
-            data.token_receiver[sidx].append([])
-            TrialOnset = np.nan
-            TrialOffset = np.nan
-            SenderPlayer = np.nan
-            ReceiverPlayer = np.nan
-            SenderPlanTime = np.nan
-            SenderMovTime = np.nan
-            SenderNumMoves = 0
-            ReceiverPlanTime = np.nan
-            ReceiverMovTime = np.nan
-            ReceiverNumMoves = 0
-            TargetNum = 0
-            TargetTime = []
-            NonTargetTime = []
-            ReceiverTargetPos = np.nan
-            Success = np.nan
-            SenderLocSuccess = np.nan
-            SenderOriSuccess = np.nan
-            ReceiverLocSuccess = np.nan
-            ReceiverOriSuccess = np.nan
-            SenderTarget = np.nan
-            ReceiverTarget = np.nan
-            Level = np.nan
-            Addressee = np.nan
+        for t, trial in enumerate(trials):
+            new_trial(trl, data, sidx)
 
             # epoch loop
-            for eidx, e in enumerate(epoch):
-                filename = glob.glob(logfile + os.path.sep + s + \
-                    '_trial_' + str(t+1) + '_' + e + '*.json')
-                if filename:
-
-                    # read in json structure
-                    with open(filename[0]) as file:
-                        val = json.load(file)
-
-                        # trial onsets and roles
-                        if ('epoch' in val[0] and val[0]['epoch'] == 'roleassignment' and (s == 'training' or s == 'game')) or \
-                                ('epoch' in val[0] and val[0]['epoch'] == 'tokenassignment' and s == 'practice'):
-                            TrialOnset = val[0]['timestamp']
-                            if 'p1' in val[0] or 'p2' in val[0]:
-                                if 'angle' in val[0]['p1']:  # tcg
-                                    if 'p1' in val[0] and 'role' in val[0]['p1'] and val[0]['p1']['role'] == 'sender':
-                                        SenderPlayer = 1
-                                        SenderTarget = [
-                                            val[0]['p1']['goal']['xPos'], val[0]['p1']['goal']['yPos'], val[0]['p1']['goal']['angle']]
-                                    elif 'p2' in val[0] and 'role' in val[0]['p2'] and val[0]['p2']['role'] == 'sender':
-                                        SenderPlayer = 2
-                                        SenderTarget = [
-                                            val[0]['p2']['goal']['xPos'], val[0]['p2']['goal']['yPos'], val[0]['p2']['goal']['angle']]
-                                    if 'p1' in val[0] and 'role' in val[0]['p1'] and val[0]['p1']['role'] == 'receiver':
-                                        ReceiverPlayer = 1
-                                        ReceiverTarget = [
-                                            val[0]['p1']['goal']['xPos'], val[0]['p1']['goal']['yPos'], val[0]['p1']['goal']['angle']]
-                                        ReceiverTargetPos = [
-                                            val[0]['p1']['goal']['xPos'], val[0]['p1']['goal']['yPos']]
-                                    elif 'p2' in val[0] and 'role' in val[0]['p2'] and val[0]['p2']['role'] == 'receiver':
-                                        ReceiverPlayer = 2
-                                        ReceiverTarget = [
-                                            val[0]['p2']['goal']['xPos'], val[0]['p2']['goal']['yPos'], val[0]['p2']['goal']['angle']]
-                                        ReceiverTargetPos = [
-                                            val[0]['p2']['goal']['xPos'], val[0]['p2']['goal']['yPos']]
-                                else:  # tcg kids
-                                    if 'p1' in val[0] and 'role' in val[0]['p1'] and val[0]['p1']['role'] == 'sender':
-                                        SenderPlayer = 1
-                                        SenderTarget = [0, 0]
-                                    elif 'p2' in val[0] and 'role' in val[0]['p2'] and val[0]['p2']['role'] == 'sender':
-                                        SenderPlayer = 2
-                                        SenderTarget = [0, 0]
-                                    if 'p1' in val[0] and 'role' in val[0]['p1'] and val[0]['p1']['role'] == 'receiver':
-                                        ReceiverPlayer = 1
-                                        ReceiverTarget = val[0]['p1']['goal']
-                                        ReceiverTargetPos = val[0]['p1']['goal']
-                                    elif 'p2' in val[0] and 'role' in val[0]['p2'] and val[0]['p2']['role'] == 'receiver':
-                                        ReceiverPlayer = 2
-                                        ReceiverTarget = val[0]['p2']['goal']
-                                        ReceiverTargetPos = val[0]['p2']['goal']
-                            # player IDs (for relating to userinput)
-                            for v in val:
-                                if 'Iamplayer' in v:
-                                    if v['Iamplayer'] == 1:
-                                        data.info[2] = 'player 1: ' + \
-                                            v['player']
-                                        try:
-                                            data.info[4] = 'date 1: ' + \
-                                                v['date']
-                                        except:
-                                            print('player 1 date not found')
-                                    elif v['Iamplayer'] == 2:
-                                        data.info[3] = 'player 2: ' + \
-                                            v['player']
-                                        try:
-                                            data.info[5] = 'date 2: ' + \
-                                                v['date']
-                                        except:
-                                            print('player 2 date not found')
-
-                        # planning and movement times
-                        if 'epoch' in val[0] and val[0]['epoch'] == 'sender':
-                            for index, v in enumerate(val):
-                                # planning & movement time
-                                if 'action' in v:
-                                    if v['action'] == 'start':
-                                        SenderMovOnset = v['timestamp']
-                                        SenderPlanTime = SenderMovOnset - \
-                                            val[0]['timestamp']  # 1st timestamp is goal onset
-                                        WaitForOffTarget = 0
-                                    elif v['action'] == 'stop' or v['action'] == 'timeout':
-                                        SenderMovOffset = v['timestamp']
-                                        SenderMovTime = SenderMovOffset - SenderMovOnset
-                                        if not TargetTime:  # empty
-                                            TargetTime = np.nan
-                                        elif TargetTime:  # not empty
-                                            TargetTime = np.nanmean(TargetTime)
-                                        if not NonTargetTime:  # empty
-                                            NonTargetTime = np.nan
-                                        elif NonTargetTime:  # not empty
-                                            NonTargetTime = np.nanmean(
-                                                NonTargetTime)
-                                    elif v['action'] == 'up' or v['action'] == 'down' or \
-                                            v['action'] == 'left' or v['action'] == 'right' or \
-                                            v['action'] == 'rotateleft' or v['action'] == 'rotateright':
-                                        SenderNumMoves = SenderNumMoves + 1
-                                        # tcg kids
-                                        if SenderNumMoves == 1 and str(v['token']['shape']).isalpha():
-                                            SenderMovOnset = v['timestamp']
-                                            SenderPlanTime = SenderMovOnset - \
-                                                val[0]['timestamp']  # 1st timestamp is goal onset
-                                            WaitForOffTarget = 0
-                                        # time spent at location
-                                        if WaitForOffTarget == 1:
-                                            TargetTime.append(
-                                                v['timestamp'] - val[index-1]['timestamp'])
-                                            WaitForOffTarget = 0
-                                        else:
-                                            NonTargetTime.append(
-                                                v['timestamp'] - val[index-1]['timestamp'])
-                                        # on target
-                                        # tcg
-                                        if str(v['token']['shape']).isnumeric() and [v['token']['xPos'], v['token']['yPos']] == ReceiverTargetPos:
-                                            TargetNum = TargetNum + 1
-                                            WaitForOffTarget = 1
-                                        # tcg kids
-                                        elif str(v['token']['shape']).isalpha() and check_target(v['token']):
-                                            TargetNum = TargetNum + 1
-                                            WaitForOffTarget = 1
-                                        # double check on target
-                                        # overlooked targets
-                                        if s != 'practice' and v['token']['onTarget'] and TargetNum == 0:
-                                            print(
-                                                'WARNING: on target missed for ' + logfile + ', ' + s + ', trial ' + str(t))
-                                # token coord & timestamps
-                                if 'token' in v:
-                                    if 'angle' in v['token']:  # tcg
-                                        data.token_sender[sidx][t].append([[v['token']['xPos'], v['token']['yPos'], v['token']['angle']],
-                                                                           v['timestamp'], v['token']['shape'], v['token']['control'], v['action'], SenderTarget])
-                                    else:  # tcg kids
-                                        data.token_sender[sidx][t].append([[v['token']['xPos'], v['token']['yPos']],
-                                                                           v['timestamp'], v['token']['shape'], v['token']['control'], v['action'], SenderTarget])
-                                        if 'addressee' in v['token']:
-                                            if v['token']['addressee'] == 'child':
-                                                Addressee = 1 # confederate played the role of the child
-                                            elif v['token']['addressee'] == 'adult':
-                                                Addressee = 2 # confederate played the role of the adult
-
-                        elif 'epoch' in val[0] and val[0]['epoch'] == 'receiver':
-                            for index, v in enumerate(val):
-                                # planning & movement time
-                                if 'action' in v:
-                                    if v['action'] == 'start':
-                                        ReceiverMovOnset = v['timestamp']
-                                        ReceiverPlanTime = ReceiverMovOnset - \
-                                            val[0]['timestamp']  # 1st timestamp is goal onset
-                                    elif v['action'] == 'stop' or v['action'] == 'timeout':
-                                        ReceiverMovOffset = v['timestamp']
-                                        ReceiverMovTime = ReceiverMovOffset - ReceiverMovOnset
-                                    elif v['action'] == 'up' or v['action'] == 'down' or \
-                                            v['action'] == 'left' or v['action'] == 'right' or \
-                                            v['action'] == 'rotateleft' or v['action'] == 'rotateright' or \
-                                            v['action'] == 'tracking':
-                                        ReceiverNumMoves = ReceiverNumMoves + 1
-                                        # tcg kids
-                                        if ReceiverNumMoves == 1 and str(v['token']['shape']).isalpha():
-                                            ReceiverMovOnset = v['timestamp']
-                                            ReceiverPlanTime = ReceiverMovOnset - \
-                                                val[0]['timestamp']  # 1st timestamp is goal onset
-                                # token coord & timestamps
-                                if 'token' in v:
-                                    if 'angle' in v['token']:  # tcg
-                                        data.token_receiver[sidx][t].append([[v['token']['xPos'], v['token']['yPos'], v['token']['angle']],
-                                                                             v['timestamp'], v['token']['shape'], v['token']['control'], v['action'], ReceiverTarget])
-                                    else:  # tcg kids
-                                        data.token_receiver[sidx][t].append([[v['token']['xPos'], v['token']['yPos']],
-                                                                             v['timestamp'], v['token']['shape'], v['token']['control'], v['action'], ReceiverTarget])
-
-                        # feedback, level and trial offset
-                        if 'epoch' in val[0] and val[0]['epoch'] == 'feedback':
-                            Success = val[0]['success']
-                            if 'p1' in val[0] and 'role' in val[0]['p1'] and val[0]['p1']['role'] == 'sender':
-                                SenderLocSuccess, SenderOriSuccess = check_feedback(
-                                    val[0]['p1'])
-                            elif 'p2' in val[0] and 'role' in val[0]['p2'] and val[0]['p2']['role'] == 'sender':
-                                SenderLocSuccess, SenderOriSuccess = check_feedback(
-                                    val[0]['p2'])
-                            if 'p1' in val[0] and 'role' in val[0]['p1'] and val[0]['p1']['role'] == 'receiver':
-                                ReceiverLocSuccess, ReceiverOriSuccess = check_feedback(
-                                    val[0]['p1'])
-                            elif 'p2' in val[0] and 'role' in val[0]['p2'] and val[0]['p2']['role'] == 'receiver':
-                                ReceiverLocSuccess, ReceiverOriSuccess = check_feedback(
-                                    val[0]['p2'])
-                            if 'level' in val[0]:
-                                Level = val[0]['level']
-                            TrialOffset = val[0]['timestamp']+1000
-
-                        # event timestamps
-                        if 'epoch' in val[0] and val[0]['epoch'] == e:
-                            # register the first timestamp
-                            data.event[sidx][t].append(val[0]['timestamp'])
+            for e, filename in trial:
+                # read in json structure, or stream its records one at a time
+                with io.TextIOWrapper(io.BytesIO(next(contents))) if prefetch else open(filename) as file:
+                    report.file(filename)
+                    with report.timer('decode'):  # with stream=True only that of the first record
+                        val = report.counted(iter_json(file) if stream else iter(json.load(file)))
+                        first = next(val)
+
+                    # hand the records to the epoch's reader
+                    with report.timer('epoch ' + e):
+                        read_epoch(trl, first, val, data, sidx, t, e)
 
             # store in data structure
-            data.trial[sidx].append([t+1, sidx+1, np.nan, TrialOnset,
-                                     SenderPlayer, SenderPlanTime, SenderMovTime, SenderNumMoves, TargetNum, TargetTime, NonTargetTime,
-                                     ReceiverPlayer, ReceiverPlanTime, ReceiverMovTime, ReceiverNumMoves,
-                                     Success, SenderLocSuccess, SenderOriSuccess, ReceiverLocSuccess, ReceiverOriSuccess, Level, TrialOffset, Addressee])
+            data.trial[sidx].append(trial_row(trl, data, sidx, t))
+
+    # one structured array per session
+    if columnar:
+        with report.timer('columnar'):
+            data.trial = [to_columnar(trials, data.dtype) for trials in data.trial]
+
+    # one array-backed trajectory store per session
+    if compact:
+        with report.timer('compact'):
+            compact_tokens(data)
+
+    # keep a parsed copy
+    if cache:
+        with report.timer('cache save'):
+            save_cache(cache, key, data, cache_size)
+    report.count('trials', sum(len(trials) for trials in data.trial))
+    report.finish(data)
     return data
 
 
+# sessions and epochs, and actions counted as moves
+sess = ['practice', 'training', 'game']
+epoch = ['roleassignment', 'tokenassignment', 'sender', 'receiver', 'feedback']
+sender_moves = {'up', 'down', 'left', 'right', 'rotateleft', 'rotateright'}
+receiver_moves = sender_moves | {'tracking'}
+
+# json files, e.g. game_trial_1_sender_bot.json as (session, trial, epoch)
+json_name = re.compile(r'([a-z]+)_trial_(\d+)_([a-z]+).*\.json$')
+
+# hash of this reader, such that parsed copies made by an earlier version are not reused
+with open(__file__, 'rb') as f:
+    source = hashlib.sha1(f.read()).hexdigest()
+
+
+def new_session(data):
+    data.trial.append([])  # multiple trials per session
+    data.event.append([])
+    data.epoch.append([])
+    data.token_sender.append([])
+    data.token_receiver.append([])
+    if data.token_sender_meta is not None:
+        data.token_sender_meta.append([])
+        data.token_receiver_meta.append([])
+
+
+def new_trial(trl, data, sidx):
+    # empty trial, keeping the movement onsets carried over between trials
+    data.event[sidx].append([])  # multiple events/locations per trial
+    data.epoch[sidx].append([])
+    data.token_sender[sidx].append([])
+    data.token_receiver[sidx].append([])
+    if data.token_sender_meta is not None:
+        data.token_sender_meta[sidx].append([])
+        data.token_receiver_meta[sidx].append([])
+    trl.update(TrialOnset=np.nan, TrialOffset=np.nan, SenderPlayer=np.nan, ReceiverPlayer=np.nan,
+               SenderPlanTime=np.nan, SenderMovTime=np.nan, SenderNumMoves=0,
+               ReceiverPlanTime=np.nan, ReceiverMovTime=np.nan, ReceiverNumMoves=0,
+               TargetNum=0, TargetTime=[], NonTargetTime=[], ReceiverTargetPos=np.nan,
+               Success=np.nan, SenderLocSuccess=np.nan, SenderOriSuccess=np.nan,
+               ReceiverLocSuccess=np.nan, ReceiverOriSuccess=np.nan,
+               SenderTarget=np.nan, ReceiverTarget=np.nan, Level=np.nan, Addressee=np.nan)
+
+
+def read_epoch(trl, first, val, data, sidx, t, e):
+    # hand the records of epoch file e (first, then the rest in val) to
+    # the epoch's reader
+    handler = epoch_handler.get((first.get('epoch'), sess[sidx] == 'practice'))
+    if handler:
+        handler(trl, first, itertools.chain([first], val), data, sidx, t)
+
+    # event timestamps
+    if first.get('epoch') == e:
+        # register the first timestamp
+        data.event[sidx][t].append(first['timestamp'])
+        data.epoch[sidx][t].append(e)
+
+
+def trial_row(trl, data, sidx, t):
+    return [t+1, sidx+1, np.nan] + [trl[l] for l in data.label[3:]]
+
+
+def role_player(first, role):
+    # 'p1' or 'p2', whichever has the role (p1 first)
+    for p in ['p1', 'p2']:
+        if p in first and first[p].get('role') == role:
+            return p
+    return None
+
+
+def read_assignment(trl, first, val, data, sidx, t):
+    # trial onsets and roles
+    trl['TrialOnset'] = first['timestamp']
+    if 'p1' in first or 'p2' in first:
+        tcg = 'angle' in first['p1']
+        p = role_player(first, 'sender')
+        if p:
+            goal = first[p]['goal']
+            trl['SenderPlayer'] = int(p[1])
+            trl['SenderTarget'] = [goal['xPos'], goal['yPos'], goal['angle']] if tcg else [0, 0]
+        p = role_player(first, 'receiver')
+        if p:
+            goal = first[p]['goal']
+            trl['ReceiverPlayer'] = int(p[1])
+            trl['ReceiverTarget'] = [goal['xPos'], goal['yPos'], goal['angle']] if tcg else goal
+            trl['ReceiverTargetPos'] = [goal['xPos'], goal['yPos']] if tcg else goal
+    # player IDs (for relating to userinput)
+    for v in val:
+        if 'Iamplayer' in v:
+            if v['Iamplayer'] == 1:
+                data.info[2] = 'player 1: ' + v['player']
+                try:
+                    data.info[4] = 'date 1: ' + v['date']
+                except:
+                    print('player 1 date not found')
+            elif v['Iamplayer'] == 2:
+                data.info[3] = 'player 2: ' + v['player']
+                try:
+                    data.info[5] = 'date 2: ' + v['date']
+                except:
+                    print('player 2 date not found')
+
+
+def read_sender(trl, first, val, data, sidx, t):
+    # planning and movement times, and time spent at locations
+    onset = trl.get('SenderMovOnset')
+    wait = trl.get('WaitForOffTarget')
+    nmoves, ntarget = trl['SenderNumMoves'], trl['TargetNum']
+    target, targetpos = trl['SenderTarget'], trl['ReceiverTargetPos']
+    tokens = data.token_sender[sidx][t]
+    meta = data.token_sender_meta[sidx][t] if data.token_sender_meta is not None else None
+    prev = None
+    for v in val:
+        action = v.get('action')
+        if action in sender_moves:
+            nmoves += 1
+            token = v['token']
+            kids = str(token['shape']).isalpha()
+            if nmoves == 1 and kids:  # tcg kids
+                onset = v['timestamp']
+                trl['SenderPlanTime'] = onset - first['timestamp']  # 1st timestamp is goal onset
+                wait = 0
+            # time spent at location
+            if wait == 1:
+                trl['TargetTime'].append(v['timestamp'] - prev['timestamp'])
+                wait = 0
+            else:
+                trl['NonTargetTime'].append(v['timestamp'] - prev['timestamp'])
+            # on target
+            if str(token['shape']).isnumeric() and [token['xPos'], token['yPos']] == targetpos:  # tcg
+                ntarget += 1
+                wait = 1
+            elif kids and check_target(token):  # tcg kids
+                ntarget += 1
+                wait = 1
+            # double check on target
+            # overlooked targets
+            if sess[sidx] != 'practice' and token['onTarget'] and ntarget == 0:
+                print('WARNING: on target missed for ' + data.info[0] + ', ' + sess[sidx] + ', trial ' + str(t))
+        elif action == 'start':
+            onset = v['timestamp']
+            trl['SenderPlanTime'] = onset - first['timestamp']  # 1st timestamp is goal onset
+            wait = 0
+        elif action == 'stop' or action == 'timeout':
+            trl['SenderMovTime'] = v['timestamp'] - onset
+            for l in ['TargetTime', 'NonTargetTime']:
+                trl[l] = np.nanmean(trl[l]) if trl[l] else np.nan
+        # token coord & timestamps
+        if 'token' in v:
+            token = v['token']
+            if 'angle' in token:  # tcg
+                tokens.append([[token['xPos'], token['yPos'], token['angle']],
+                               v['timestamp'], token['shape'], token['control'], v['action'], target])
+            else:  # tcg kids
+                tokens.append([[token['xPos'], token['yPos']],
+                               v['timestamp'], token['shape'], token['control'], v['action'], target])
+                if token.get('addressee') == 'child':
+                    trl['Addressee'] = 1  # confederate played the role of the child
+                elif token.get('addressee') == 'adult':
+                    trl['Addressee'] = 2  # confederate played the role of the adult
+            if meta is not None:
+                meta.append((prev['timestamp'] if prev else -1, token_goal(token)))
+        prev = v
+    trl['SenderNumMoves'], trl['TargetNum'] = nmoves, ntarget
+    if onset is not None:
+        trl['SenderMovOnset'] = onset
+    if wait is not None:
+        trl['WaitForOffTarget'] = wait
+
+
+def read_receiver(trl, first, val, data, sidx, t):
+    # planning and movement times
+    onset = trl.get('ReceiverMovOnset')
+    nmoves = trl['ReceiverNumMoves']
+    target = trl['ReceiverTarget']
+    tokens = data.token_receiver[sidx][t]
+    meta = data.token_receiver_meta[sidx][t] if data.token_receiver_meta is not None else None
+    prev = None
+    for v in val:
+        action = v.get('action')
+        if action in receiver_moves:
+            nmoves += 1
+            if nmoves == 1 and str(v['token']['shape']).isalpha():  # tcg kids
+                onset = v['timestamp']
+                trl['ReceiverPlanTime'] = onset - first['timestamp']  # 1st timestamp is goal onset
+        elif action == 'start':
+            onset = v['timestamp']
+            trl['ReceiverPlanTime'] = onset - first['timestamp']  # 1st timestamp is goal onset
+        elif action == 'stop' or action == 'timeout':
+            trl['ReceiverMovTime'] = v['timestamp'] - onset
+        # token coord & timestamps
+        if 'token' in v:
+            token = v['token']
+            if 'angle' in token:  # tcg
+                tokens.append([[token['xPos'], token['yPos'], token['angle']],
+                               v['timestamp'], token['shape'], token['control'], v['action'], target])
+            else:  # tcg kids
+                tokens.append([[token['xPos'], token['yPos']],
+                               v['timestamp'], token['shape'], token['control'], v['action'], target])
+            if meta is not None:
+                meta.append((prev['timestamp'] if prev else -1, token_goal(token)))
+        prev = v
+    trl['ReceiverNumMoves'] = nmoves
+    if onset is not None:
+        trl['ReceiverMovOnset'] = onset
+
+
+def read_feedback(trl, first, val, data, sidx, t):
+    # feedback, level and trial offset
+    trl['Success'] = first['success']
+    p = role_player(first, 'sender')
+    if p:
+        trl['SenderLocSuccess'], trl['SenderOriSuccess'] = check_feedback(first[p])
+    p = role_player(first, 'receiver')
+    if p:
+        trl['ReceiverLocSuccess'], trl['ReceiverOriSuccess'] = check_feedback(first[p])
+    if 'level' in first:
+        trl['Level'] = first['level']
+    trl['TrialOffset'] = first['timestamp']+1000
+
+
+# reader per (epoch of the first record, practice session)
+epoch_handler = {('roleassignment', False): read_assignment,
+                 ('tokenassignment', True): read_assignment,
+                 ('sender', False): read_sender, ('sender', True): read_sender,
+                 ('receiver', False): read_receiver, ('receiver', True): read_receiver,
+                 ('feedback', False): read_feedback, ('feedback', True): read_feedback}
+
+
+def read_json_tcg_cohort(dirs, workers=None, **options):
+    # list of room folders
+    if isinstance(dirs, str):
+        dirs = [d for d in sorted(glob.glob(os.path.join(dirs, '*'))) if os.path.isdir(d)]
+
+    # read the rooms in parallel, keeping the order of the input
+    group_data = [None] * len(dirs)
+    errors = {}
+    todo = []
+    for i, d in enumerate(dirs):
+        if os.path.isdir(d):
+            todo.append(i)
+        else:  # listed explicitly, but missing
+            errors[d] = 'no such folder'
+    if workers == 1:
+        for i in todo:
+            try:
+                group_data[i] = read_json_tcg(dirs[i], **options)
+            except Exception as err:
+                errors[dirs[i]] = repr(err)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(read_json_tcg, dirs[i], **options) for i in todo]
+            for i, f in zip(todo, futures):
+                try:
+                    group_data[i] = f.result()
+                except Exception as err:
+                    errors[dirs[i]] = repr(err)
+
+    # report failed rooms, which are left as None
+    for d in errors:
+        print('a problem arose reading ' + d + ': ' + errors[d])
+    return group_data, errors
+
+
+def prefetch_json(filenames, workers):
+    # contents of the files in order, with up to workers reads in flight
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for f in filenames:
+            pending.append(pool.submit(read_bytes, f))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_bytes(filename):
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+def iter_json(file, size=8192):
+    # records of a top-level json array, decoded one at a time
+    if ijson is not None:
+        yield from ijson.items(file.buffer, 'item', use_float=True)
+        return
+    decoder = json.JSONDecoder()
+    buf = file.read(size)
+    pos = buf.index('[') + 1
+    while True:
+        # skip whitespace and separators, reading ahead if needed
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buf):
+            buf, pos = file.read(size), 0
+            if not buf:
+                return
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            v, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            more = file.read(size)
+            if not more:  # truncated file
+                raise
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield v
+
+
+def session_files(files, s):
+    # per trial (1 to the highest trial number) of session s, the (epoch,
+    # json file) pairs that exist, in the order they are read
+    ntrls = max([k[1] for k in files if k[0] == s], default=0)
+    return [[(e, files[(s, t+1, e)]) for e in epoch if (s, t+1, e) in files] for t in range(ntrls)]
+
+
+def index_json_tcg(logfile):
+    # map (session, trial, epoch) to the json file, e.g. game_trial_1_sender_bot.json
+    files = {}
+    with os.scandir(logfile) as it:
+        for entry in it:
+            name = json_name.match(entry.name)
+            if name:
+                files[(name.group(1), int(name.group(2)), name.group(3))] = entry.path
+    return files
+
+
+def to_columnar(trials, dtype):
+    # rows (trials) x columns (variables) to a structured array
+    rows = []
+    for trial in trials:
+        row = []
+        for x in trial:
+            if isinstance(x, list):  # unfinished sender epoch, location times not averaged
+                x = np.nanmean(x) if x else np.nan
+            row.append(x)
+        rows.append(tuple(row))
+    return np.array(rows, dtype=dtype)
+
+
+def cache_key(logfile, files, *options):
+    # room path, read options and reader version, plus name, modification time
+    # and size of every json file
+    key = hashlib.sha1((os.path.abspath(logfile) + repr(options) + source).encode())
+    for f in sorted(files.values()):
+        st = os.stat(f)
+        key.update(('%s %d %d' % (os.path.basename(f), st.st_mtime_ns, st.st_size)).encode())
+    return key.hexdigest()
+
+
+def load_cache(cache, key):
+    filename = os.path.join(cache, key + '.pkl')
+    try:
+        with open(filename, 'rb') as file:
+            data = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(filename)  # mark as recently used
+    return data
+
+
+def save_cache(cache, key, data, cache_size):
+    os.makedirs(cache, exist_ok=True)
+    filename = os.path.join(cache, key + '.pkl')
+    with open(filename + '.tmp' + str(os.getpid()), 'wb') as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + '.tmp' + str(os.getpid()), filename)
+
+    # evict least recently used copies beyond cache_size (megabytes)
+    entries = []
+    for entry in os.scandir(cache):
+        if entry.name.endswith('.pkl'):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= cache_size * 1e6 or path == filename:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
 def check_feedback(p):
     loc, ori = 0, 0
     # location
@@ -329,22 +649,68 @@ def check_feedback(p):
     return loc, ori
 
 
+# field location of each tcg kids goal
+target_field = [[-1, 1], [0, 1], [0, 1], [1, 1], [1, 1],
+                [-1, 0], [-1, 0], [-1, 0], [1, 0],
+                [-1, -1], [0, -1], [0, -1], [1, -1], [1, -1], [1, -1]]
+
+
+def token_goal(token):
+    # goal (field) number of a tcg kids token, 0 for tcg tokens
+    goal = token.get('goal')
+    return goal if isinstance(goal, int) else 0
+
+
+def collect_meta(data):
+    # per-row meta of the token rows, for compact_tokens (before the first session)
+    data.token_sender_meta = []
+    data.token_receiver_meta = []
+
+
+def compact_tokens(data):
+    # one Trajectory per session, taking over the per-row meta (if collected)
+    n = len(data.token_sender)
+    data.token_sender = [Trajectory(*x) for x in zip(data.token_sender, data.token_sender_meta or [None] * n)]
+    data.token_receiver = [Trajectory(*x) for x in zip(data.token_receiver, data.token_receiver_meta or [None] * n)]
+    data.token_sender_meta = None
+    data.token_receiver_meta = None
+
+
 def check_target(t):
-    # field
-    field = [None] * 15
-    field[0] = [-1, 1]
-    field[1] = [0, 1]
-    field[2] = [0, 1]
-    field[3] = [1, 1]
-    field[4] = [1, 1]
-    field[5] = [-1, 0]
-    field[6] = [-1, 0]
-    field[7] = [-1, 0]
-    field[8] = [1, 0]
-    field[9] = [-1, -1]
-    field[10] = [0, -1]
-    field[11] = [0, -1]
-    field[12] = [1, -1]
-    field[13] = [1, -1]
-    field[14] = [1, -1]
-    return [t['xPos'], t['yPos']] == field[t['goal']-1]
+    return [t['xPos'], t['yPos']] == target_field[t['goal']-1]
+
+
+def check_target_array(xpos, ypos, goal, field=target_field):
+    # check_target over arrays of token positions and goals
+    loc = np.asarray(field)[np.asarray(goal, dtype=int) - 1]
+    return (np.asarray(xpos) == loc[:, 0]) & (np.asarray(ypos) == loc[:, 1])
+
+
+def check_feedback_array(shape, xpos, ypos, angle, goal_xpos, goal_ypos, goal_angle):
+    # check_feedback over arrays of final token states, where shape holds
+    # 1, 2, 3 (rectangle, circle, triangle) or 'bird', 'squirrel' (tcg kids),
+    # and goals are unused (e.g. NaN) for the tcg kids shapes
+    shape = np.asarray(shape)
+    if shape.dtype.kind in 'biuf':  # numeric, e.g. NaN-padded or parquet columns
+        code = shape.astype(float)
+    else:  # as numbers where possible, such that '1' and 1.0 are both rectangles
+        names, inverse = np.unique(shape.astype(str), return_inverse=True)
+        code = np.array([float(v) if v.replace('.', '', 1).isdigit() else np.nan for v in names])[inverse].reshape(shape.shape)
+    shape = shape.astype(str)
+    xpos, ypos, angle = np.asarray(xpos, dtype=float), np.asarray(ypos, dtype=float), np.asarray(angle, dtype=float)
+    goal_xpos, goal_ypos, goal_angle = np.asarray(goal_xpos, dtype=float), np.asarray(goal_ypos, dtype=float), np.asarray(goal_angle, dtype=float)
+    bird, squirrel = shape == 'bird', shape == 'squirrel'
+    # location
+    loc = np.where(bird, (xpos == 0) & (ypos == 0), (xpos == goal_xpos) & (ypos == goal_ypos)).astype(float)
+    loc[squirrel] = np.nan
+    # orientation
+    ori = np.select([bird | squirrel,
+                     code == 1,  # rectangle
+                     code == 2,  # circle
+                     code == 3],  # triangle
+                    [True,
+                     (angle == goal_angle) | (np.abs(angle - goal_angle) == 180),
+                     loc == 1,
+                     angle == goal_angle],
+                    False).astype(int)
+    return loc, ori
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+READ_USERINPUT reads the questionnaire answers (userinput.csv)
+of communication game rooms into a single table
+
+INPUT
+Use as: ui = read_userinput('../data/TCG_WI22')
+where the folder contains room folders with a 'userinput.csv', or
+is a room folder itself, or a list of either; each line of the file
+holds a player ID and an answer, e.g.
+"148244013.46880388", "AQ10_1: Slightly Agree"
+
+OUTPUT
+ui.table    numpy structured array with one row per answer, sorted by
+            player, with columns room, player, item (e.g. 'AQ10_1',
+            'age'), code (Likert code, -1 if not a Likert answer) and
+            answer (the text after the item)
+ui.players  sorted player IDs, where the rows of ui.players[i] are
+            ui.table[ui.offset[i]:ui.offset[i+1]], and ui[player]
+            returns these rows
+
+Likert codes
+AQ10        1 Definitely Agree, 2 Slightly Agree, 3 Slightly Disagree,
+            4 Definitely Disagree
+RAADS14     0 Never true, 1 True only when I was younger than 16,
+            2 True only now, 3 True now and when I was young
+
+Use as: score = ui.aq_score()
+for the AQ-10 score (0-10) of all players at once, aligned with
+ui.players (NaN if not all 10 items were answered)
+
+Use as: ids = player_ids(data)
+        score = ui.aq_score(ids)
+to join the answers to a room read with read_json_tcg, whose
+data.info holds 'player 1: <ID>' and 'player 2: <ID>', or pass
+the IDs of a whole cohort at once (NaN for unknown players)
+--------------------------------------------------------
+"""
+
+
+import os
+import re
+import glob
+import numpy as np
+
+
+# Likert code per answer
+likert = {'Definitely Agree': 1, 'Slightly Agree': 2,
+          'Slightly Disagree': 3, 'Definitely Disagree': 4,
+          'Never true': 0, 'True only when I was younger than 16': 1,
+          'True only now': 2, 'True now and when I was young': 3}
+
+# AQ-10 items scored for agreeing, the others are scored for disagreeing
+aq10_agree = [1, 7, 8, 10]
+
+
+class Userinput(object):
+    # answers of all players, grouped by player
+    def __init__(self, room, player, item, code, answer):
+        columns = {'room': shrink(room), 'player': shrink(player), 'item': shrink(item),
+                   'code': np.array(code, dtype=np.int8), 'answer': shrink(answer)}
+        table = np.empty(len(columns['code']), dtype=[(l, c.dtype) for l, c in columns.items()])
+        for l, c in columns.items():
+            table[l] = c
+        self.table = table[np.argsort(table['player'], kind='stable')]
+        self.players, start = np.unique(self.table['player'], return_index=True)
+        self.offset = np.r_[start, len(self.table)]
+
+    def __len__(self):
+        return len(self.players)
+
+    def __getitem__(self, player):
+        i = self.find(player)
+        if i < 0:
+            raise KeyError(player)
+        return self.table[self.offset[i]:self.offset[i+1]]
+
+    def find(self, ids):
+        # index of each ID in self.players, -1 for unknown IDs
+        ids = np.asarray(ids, dtype=str)
+        idx = np.clip(np.searchsorted(self.players, ids), 0, max(len(self.players) - 1, 0))
+        found = (self.players[idx] == ids) if len(self.players) else np.zeros(ids.shape, dtype=bool)
+        return np.where(found, idx, -1)
+
+    def aq_score(self, ids=None):
+        # AQ-10 score per player, or per ID in ids
+        rows = self.table[np.char.startswith(self.table['item'], 'AQ10_')]
+        answered = rows['code'] > 0
+        agree = answered & (rows['code'] <= 2)
+        point = np.where(np.isin(rows['item'], ['AQ10_%d' % i for i in aq10_agree]), agree, answered & ~agree)
+        player = np.searchsorted(self.players, rows['player'])
+        score = np.bincount(player, point, minlength=len(self.players)).astype(float)
+        score[np.bincount(player, answered, minlength=len(self.players)) < 10] = np.nan
+        if ids is None:
+            return score
+        idx = self.find(ids)
+        return np.where(idx >= 0, np.append(score, np.nan)[idx], np.nan)
+
+
+def read_userinput(dirs):
+    # userinput.csv files of the rooms
+    if isinstance(dirs, str):
+        dirs = [dirs]
+    files = []
+    for d in dirs:
+        if os.path.isfile(os.path.join(d, 'userinput.csv')):
+            files.append(os.path.join(d, 'userinput.csv'))
+        else:
+            files += sorted(glob.glob(os.path.join(d, '*', 'userinput.csv')))
+
+    # player and answer of every line
+    room, player, answer = [], [], []
+    for f in files:
+        try:
+            with open(f) as file:
+                lines = re.findall(r'^"(.*?)", "(.*)"\s*$', file.read(), re.M)
+        except OSError:
+            print('a problem arose reading ' + f)
+            continue
+        room += [os.path.basename(os.path.dirname(f))] * len(lines)
+        player += [l[0] for l in lines]
+        answer += [l[1] for l in lines]
+
+    # item and Likert code of all lines at once
+    answer = np.array(answer, dtype=str)
+    parts = np.char.partition(answer, ': ') if len(answer) else np.empty((0, 3), dtype=str)
+    values, inverse = np.unique(parts[:, 2], return_inverse=True)
+    code = np.array([likert.get(v, -1) for v in values], dtype=np.int8)[inverse] if len(values) else []
+    return Userinput(room, player, parts[:, 0], code, parts[:, 2])
+
+
+def shrink(values):
+    # strings as the narrowest unicode array
+    values = np.array(values, dtype=str)
+    width = np.char.str_len(values).max() if len(values) else 1
+    return values.astype('U%d' % max(width, 1))
+
+
+def player_ids(data):
+    # player 1 and player 2 IDs of a room read with read_json_tcg (None if absent)
+    return [i.partition(': ')[2] if i else None for i in data.info[2:4]]
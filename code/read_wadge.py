@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+READ_WADGE reads the pair files of Wadge et al., Cortex 2019
+(A.csv ... Z.csv) and their Subject_Summary.xlsx into two tables
+
+INPUT
+Use as: wc = read_wadge('../data/WadgeCortex19')
+or as:  wc = read_wadge('../data/WadgeCortex19', cache='wadge_cache')
+to keep a binary (npz) copy of both tables in the 'wadge_cache' folder,
+which is used as long as none of the files has changed, such that the
+excel sheet (which requires pandas and openpyxl) is read only once
+
+OUTPUT
+wc.trial    numpy structured array with one row per trial of all pairs,
+            with columns pair (e.g. 'A'), group ('ASD', 'Typ', 'Mix'),
+            trial (0-79) and those of the csv files (S1_PlanTime,
+            ..., Accuracy, Signal)
+wc.summary  numpy structured array with one row per pair, sorted by
+            pair, with columns pair, group, success (summed Accuracy
+            out of 80 trials) and those of the excel sheet (S1IQ, ...)
+wc.pairs    pair names, where the trials of wc.pairs[i] are
+            wc.trial[wc.offset[i]:wc.offset[i+1]]
+
+Pair types, as in Lab8
+ASD         A, B, C, D, E, F, L (two individuals with ASD)
+Typ         G, H, R-Z (two individuals with no clinical diagnosis)
+Mix         I, J, K, M-Q (one of each)
+
+Use as: mean, std, n = aggregate(wc.summary['success'], wc.summary['group'])
+for summary statistics of any column per group (in the order of
+groups, std with ddof=0 as np.std), or of wc.trial columns per pair
+with wc.trial['pair'] as labels
+
+Use as: fit = ols(wc.summary['success'], zscore(wc.summary['Pair_minimumIQ']))
+for the least squares fit of the success on an intercept and the
+predictors (pairs, or pairs x predictors), with fit['beta'], fit['se'],
+fit['t'], fit['df'] and fit['r2']; y and the predictors may carry
+leading batch dimensions to fit many models at once (e.g. the mean and
+minimum IQ as a batch of two), and
+adj = regress_out(y, x)
+for the success after removing the contribution of x, as in Lab8
+
+Use as: diff, ci = bootstrap(adj, wc.summary['group'], nboot=10000, seed=1)
+for the difference in mean between each pair of groups (ASD-Mix,
+ASD-Typ, Mix-Typ), over 10000 resamples of the pairs within their group,
+and its 95% confidence interval
+--------------------------------------------------------
+"""
+
+
+import os
+import glob
+import hashlib
+import numpy as np
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+# pair types
+groups = {'ASD': ['A', 'B', 'C', 'D', 'E', 'F', 'L'],
+          'Mix': ['I', 'J', 'K', 'M', 'N', 'O', 'P', 'Q'],
+          'Typ': ['G', 'H', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z']}
+ntrials = 80
+
+
+class Wadge(object):
+    def __init__(self, trial, summary):
+        self.trial = trial
+        self.summary = summary
+        self.pairs, start = np.unique(trial['pair'], return_index=True)
+        self.offset = np.r_[start, len(trial)]
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __getitem__(self, pair):
+        i = np.searchsorted(self.pairs, pair)
+        if i >= len(self.pairs) or self.pairs[i] != pair:
+            raise KeyError(pair)
+        return self.trial[self.offset[i]:self.offset[i+1]]
+
+
+def read_wadge(data_dir, cache=None):
+    files = sorted(glob.glob(os.path.join(data_dir, '[A-Z].csv')))
+    summary_file = os.path.join(data_dir, 'Subject_Summary.xlsx')
+    if cache:
+        key = cache_key(files + [summary_file])
+        try:
+            with np.load(os.path.join(cache, key + '.npz')) as f:
+                return Wadge(f['trial'], f['summary'])
+        except (OSError, KeyError, ValueError):
+            pass
+
+    # all pair files into one table
+    pair, values, label = [], [], None
+    for f in files:
+        try:
+            with open(f) as file:
+                header = file.readline().strip().split(',')
+                rows = np.loadtxt(file, delimiter=',', ndmin=2, converters=lambda v: float(v or 'nan'))  # empty as NaN
+        except (OSError, ValueError):
+            print('a problem arose reading ' + f)
+            continue
+        if label is None:
+            label = header
+        elif header != label:
+            print('a problem arose reading ' + f + ', the columns differ')
+            continue
+        pair += [os.path.splitext(os.path.basename(f))[0]] * len(rows)
+        values.append(rows)
+    label = label or []
+    values = np.vstack(values) if values else np.zeros((0, len(label)))
+    pair = np.array(pair, dtype='U1')
+    trial = np.zeros(len(pair), dtype=[('pair', 'U1'), ('group', 'U3'), ('trial', 'i4')] + [(l, 'f8') for l in label])
+    trial['pair'] = pair
+    trial['group'] = group_of(pair)
+    trial['trial'] = np.arange(len(pair)) - np.searchsorted(pair, pair)
+    for i, l in enumerate(label):
+        trial[l] = values[:, i]
+
+    # pair success, joined to the subject summary
+    pairs, start = np.unique(pair, return_index=True)
+    success = np.add.reduceat(trial['Accuracy'], start) / ntrials if len(start) else np.zeros(0)
+    summary = join_summary(read_summary(summary_file), pairs, success)
+
+    if cache:
+        os.makedirs(cache, exist_ok=True)
+        filename = os.path.join(cache, key + '.npz')
+        with open(filename + '.tmp' + str(os.getpid()), 'wb') as file:
+            np.savez(file, trial=trial, summary=summary)
+        os.replace(filename + '.tmp' + str(os.getpid()), filename)
+    return Wadge(trial, summary)
+
+
+def read_summary(filename):
+    # excel sheet as a structured array, strings as unicode
+    if pd is None:
+        print('a problem arose reading ' + filename + ', pandas is not installed')
+        return None
+    try:
+        sheet = pd.read_excel(filename)
+    except (OSError, ImportError, ValueError):
+        print('a problem arose reading ' + filename)
+        return None
+    columns = {}
+    for l in sheet.columns:
+        c = sheet[l]
+        if c.dtype.kind in 'iuf':
+            columns[str(l)] = c.to_numpy()
+        else:
+            columns[str(l)] = np.array(c.astype(str).to_numpy(), dtype=str)
+    table = np.zeros(len(sheet), dtype=[(l, c.dtype) for l, c in columns.items()])
+    for l, c in columns.items():
+        table[l] = c
+    return table
+
+
+def join_summary(sheet, pairs, success):
+    # one row per pair, with the sheet's columns where available
+    extra = []
+    if sheet is not None and 'Pair_name' in sheet.dtype.names:
+        extra = [(l, sheet.dtype[l] if sheet.dtype[l].kind != 'i' else 'f8')
+                 for l in sheet.dtype.names if l != 'Pair_name']
+    summary = np.zeros(len(pairs), dtype=[('pair', 'U1'), ('group', 'U3'), ('success', 'f8')] + extra)
+    summary['pair'] = pairs
+    summary['group'] = group_of(pairs)
+    summary['success'] = success
+    if extra:
+        idx = {p: i for i, p in enumerate(sheet['Pair_name'])}
+        rows = np.array([idx.get(p, -1) for p in pairs], dtype=int)
+        for l, dt in extra:
+            col = sheet[l][np.maximum(rows, 0)].astype(dt)
+            if np.dtype(dt).kind == 'f':
+                col[rows < 0] = np.nan
+            summary[l] = col
+    return summary
+
+
+def group_of(pairs):
+    # pair type of each pair name, '' if unknown
+    lookup = {p: g for g, ps in groups.items() for p in ps}
+    return np.array([lookup.get(p, '') for p in pairs], dtype='U3')
+
+
+def cache_key(files):
+    # name, modification time and size of every file
+    key = hashlib.sha1()
+    for f in files:
+        try:
+            st = os.stat(f)
+        except OSError:
+            continue
+        key.update(('%s %d %d' % (os.path.basename(f), st.st_mtime_ns, st.st_size)).encode())
+    return key.hexdigest()
+
+
+def aggregate(values, labels, order=None):
+    # mean, std and count of values per label (per group, by default)
+    if order is None:
+        order = list(groups) if set(np.unique(labels)) <= set(groups) else list(np.unique(labels))
+    lookup = {l: i for i, l in enumerate(order)}
+    idx = np.array([lookup.get(l, -1) for l in labels], dtype=int)
+    values = np.asarray(values, dtype=float)[idx >= 0]
+    idx = idx[idx >= 0]
+    n = np.bincount(idx, minlength=len(order)).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(idx, values, minlength=len(order)) / n
+        std = np.sqrt(np.bincount(idx, (values - mean[idx]) ** 2, minlength=len(order)) / n)
+    return mean, std, n
+
+
+def zscore(x, axis=-1):
+    # as scipy.stats.zscore (ddof=0)
+    x = np.asarray(x, dtype=float)
+    return (x - x.mean(axis=axis, keepdims=True)) / x.std(axis=axis, keepdims=True)
+
+
+def ols(y, x):
+    # least squares of y (... x n) on an intercept and x (... x n for a single
+    # predictor, or ... x n x k), broadcasting over the leading dimensions
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    if x.shape[-1] == y.shape[-1]:  # a single predictor
+        x = x[..., None]
+    X = np.concatenate([np.ones(x.shape[:-1] + (1,)), x], axis=-1)
+    y = np.broadcast_to(y, np.broadcast_shapes(y.shape, X.shape[:-1]))
+    XtX = np.swapaxes(X, -1, -2) @ X
+    inv = np.linalg.inv(XtX)
+    beta = (inv @ (np.swapaxes(X, -1, -2) @ y[..., None]))[..., 0]
+    res = y - (X @ beta[..., None])[..., 0]
+    df = X.shape[-2] - X.shape[-1]
+    sigma2 = np.sum(res ** 2, axis=-1) / df
+    se = np.sqrt(sigma2[..., None] * np.diagonal(inv, axis1=-2, axis2=-1))
+    tss = np.sum((y - y.mean(axis=-1, keepdims=True)) ** 2, axis=-1)
+    return {'beta': beta, 'se': se, 't': beta / se, 'df': df,
+            'r2': 1 - np.sum(res ** 2, axis=-1) / tss, 'residual': res}
+
+
+def regress_out(y, x):
+    # y minus the predicted contribution of x alone (intercept zeroed, as in Lab8)
+    x = zscore(x)
+    fit = ols(y, x)
+    return np.asarray(y, dtype=float) - fit['beta'][..., 1:2] * x
+
+
+def bootstrap(values, labels, nboot=10000, seed=None, order=None, ci=95):
+    # differences in mean between every two groups over resamples of their members
+    order = list(groups) if order is None else list(order)
+    values = np.asarray(values, dtype=float)
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    means = []
+    for g in order:
+        v = values[labels == g]
+        means.append(v[rng.integers(0, len(v), (nboot, len(v)))].mean(axis=1) if len(v) else np.full(nboot, np.nan))
+    means = np.stack(means, axis=1)
+    a, b = np.triu_indices(len(order), k=1)
+    diff = means[:, a] - means[:, b]
+    bounds = np.nanpercentile(diff, [(100 - ci) / 2, 100 - (100 - ci) / 2], axis=0) if nboot else np.full((2, len(a)), np.nan)
+    return diff, bounds
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+RSA computes recursive speaker and listener inferences (rational
+speech acts, Frank & Goodman, 2012) for stacks of lexicons
+
+INPUT
+Use as: S, L = rsa(M, depth=1)
+where M is a signals x referents lexicon (1 where a signal applies to
+a referent), or a batch x signals x referents stack of lexicons
+
+OUTPUT
+S[k]    speaker of level k, P(signal | referent), normalized over signals
+L[k]    listener of level k, P(referent | signal), normalized over referents
+with the shape of M, where S[0] and L[0] are the literal speaker and
+listener, S[k] reasons about L[k-1] and L[k] about S[k], as in Lab2
+(S0 = M / np.sum(M, axis=0), L0 = M / np.sum(M, axis=1)[:,None], etc.)
+
+Use as: S, L = rsa(M, depth=3, alpha=2, prior=prior, cost=cost)
+with alpha the speaker's rationality (the same at every level),
+S[k] ~ (L[k-1] * exp(-cost))^alpha, prior a distribution over referents,
+L[k] ~ S[k] * prior, and cost a cost per signal, each either shared or
+given per lexicon of the batch (alpha: batch, prior: batch x referents,
+cost: batch x signals)
+
+These batch dimensions broadcast against those of M, e.g.
+S, L = rsa(M, depth=3, alpha=np.array([1, 2, 4]))
+for a single 4 x 3 lexicon gives three models, one per alpha, with
+S[k] and L[k] 3 x 4 x 3 for k >= 1; S[0] and L[0] only broadcast with
+the parameters they use (cost for S[0], prior for L[0]), such that here
+they keep the shape of M
+
+Signals that apply to no referent, and referents without any signal,
+remain all zero instead of dividing by zero
+
+Use as: M = all_lexicons(4, 3)
+for the stack of all 2^12 binary 4 x 3 lexicons, and
+ll = loglik(L[1], signal, referent)
+for the log-likelihood of observed signal/referent choices under each
+model of the batch
+--------------------------------------------------------
+"""
+
+
+import numpy as np
+
+
+def normalize(x, axis):
+    # x / sum(x) along axis, leaving all-zero slices at zero
+    total = np.sum(x, axis=axis, keepdims=True)
+    return np.divide(x, total, out=np.zeros(np.broadcast_shapes(x.shape, total.shape)), where=total > 0)
+
+
+def literal_speaker(M, cost=None):
+    # S0, P(signal | referent) of the lexicon
+    M = np.asarray(M, dtype=float)
+    if cost is not None:
+        M = M * np.exp(-np.asarray(cost, dtype=float))[..., :, None]
+    return normalize(M, axis=-2)
+
+
+def literal_listener(M, prior=None):
+    # L0, P(referent | signal) of the lexicon
+    M = np.asarray(M, dtype=float)
+    if prior is not None:
+        M = M * np.asarray(prior, dtype=float)[..., None, :]
+    return normalize(M, axis=-1)
+
+
+def speaker(L, alpha=1., cost=None):
+    # pragmatic speaker, choosing signals that lead the listener L to the referent
+    U = np.asarray(L, dtype=float)
+    if cost is not None:
+        U = U * np.exp(-np.asarray(cost, dtype=float))[..., :, None]
+    alpha = np.asarray(alpha, dtype=float)[..., None, None]
+    return normalize(U ** alpha, axis=-2)
+
+
+def listener(S, prior=None):
+    # pragmatic listener, inverting the speaker S
+    return literal_listener(S, prior)
+
+
+def rsa(M, depth=1, alpha=1., prior=None, cost=None):
+    S = [literal_speaker(M, cost)]
+    L = [literal_listener(M, prior)]
+    for k in range(depth):
+        S.append(speaker(L[-1], alpha, cost))
+        L.append(listener(S[-1], prior))
+    return S, L
+
+
+def all_lexicons(nsignals, nreferents):
+    # batch x signals x referents stack of every binary lexicon
+    n = nsignals * nreferents
+    bits = (np.arange(2 ** n)[:, None] >> np.arange(n)[::-1]) & 1
+    return bits.reshape(-1, nsignals, nreferents).astype(np.int8)
+
+
+def loglik(P, rows, cols, floor=1e-12):
+    # summed log-probability of observed (row, column) choices, e.g. (signal,
+    # referent) under a listener, per model of the batch
+    P = np.asarray(P, dtype=float)
+    return np.sum(np.log(np.maximum(P[..., rows, cols], floor)), axis=-1)
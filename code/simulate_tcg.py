@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+SIMULATE_TCG plays communication game sessions between simulated
+sender and receiver agents
+
+INPUT
+Use as: data = simulate_tcg(seed=1, ntrials=100)
+for one simulated room, returning the same structure as read_json_tcg
+(with the columnar and compact options); the agents play the game
+session on the 3 x 3 grid, alternating roles every trial, where the
+sender first visits (and pauses at) the receiver's goal, rotating its
+token to the goal's orientation, and then moves to its own goal, and
+the receiver decodes the goal with a probability that drops with the
+level (which goes up after every 10 successful trials)
+
+The trials are generated as the records of the epoch json files and
+read by the epoch readers of read_json_tcg, such that all variables
+(planning and movement times, moves, time on/off target, and success
+via check_feedback) are defined as for real rooms
+
+Use as: data = simulate_tcg(seed=1, receiver_skill=.7, move_time=300)
+to change the agents (see params below for all parameters)
+
+Use as: group_data = simulate_tcg_cohort(1000, seed=0, workers=8)
+to simulate 1000 rooms in parallel processes, where room i is seeded
+by the i-th child of np.random.SeedSequence(seed), so the rooms are
+reproducible irrespective of the number of workers
+
+Use as: simulate_tcg_cohort(1000, out_dir='sim_parquet')
+to write the rooms as the partitioned parquet tables of export_tcg
+(cohort=SIM), instead of returning them
+--------------------------------------------------------
+"""
+
+
+import os
+import datetime
+import concurrent.futures
+import numpy as np
+
+from read_json_tcg import Data, sess, epoch, new_session, new_trial, read_epoch, trial_row, to_columnar, collect_meta, compact_tokens, check_feedback
+
+
+# agent parameters, times in milliseconds (median of a lognormal)
+params = {'sender_skill': .95,      # probability the sender signals the receiver's goal
+          'receiver_skill': .95,    # probability the receiver decodes the signal, at level 2
+          'level_cost': .04,        # drop in that probability per level
+          'sender_noise': .02,      # probability the sender misses its own goal
+          'sender_plan_time': 4000, 'receiver_plan_time': 1200,
+          'move_time': 450, 'target_time': 1000, 'spread': .5,
+          'level_up': 10}           # successful trials per level
+
+# grid, moves and orientations
+positions = [(x, y) for x in [-1, 0, 1] for y in [-1, 0, 1]]
+angles = [0, 90, 180, 270]
+steps = {'up': (0, 1), 'down': (0, -1), 'left': (-1, 0), 'right': (1, 0)}
+
+
+def simulate_tcg(seed=None, ntrials=100, columnar=False, compact=False, name=None, **options):
+    p = dict(params, **options)
+    rng = np.random.default_rng(seed)
+    ids = ['%.8f' % (rng.random() * 1e9) for _ in range(2)]
+    start = 1.6e12 + rng.integers(0, 1e11)
+
+    # recording information
+    data = Data()
+    data.info[0] = name or 'sim' + ids[0]
+    data.info[1] = datetime.datetime.fromtimestamp(start / 1000).strftime('%Y-%m-%d-%H:%M')
+    if compact:
+        collect_meta(data)
+    for sidx in range(len(sess)):
+        new_session(data)
+
+    # game session
+    sidx, trl, clock = sess.index('game'), {}, [int(start)]
+    level, nsuccess = 2, 0
+    for t in range(ntrials):
+        new_trial(trl, data, sidx)
+        records = play_trial(rng, p, t, level, ids, clock)
+        for e in epoch:
+            read_epoch(trl, records[e][0], iter(records[e][1:]), data, sidx, t, e)
+        data.trial[sidx].append(trial_row(trl, data, sidx, t))
+        nsuccess += trl['Success']
+        if trl['Success'] and nsuccess % p['level_up'] == 0:
+            level += 1
+
+    if columnar:
+        data.trial = [to_columnar(trials, data.dtype) for trials in data.trial]
+    if compact:
+        compact_tokens(data)
+    return data
+
+
+def play_trial(rng, p, t, level, ids, clock):
+    # records of the five epoch files of a trial, advancing clock[0]
+    def tick(median):
+        clock[0] += max(int(rng.lognormal(np.log(median), p['spread'])), 1)
+        return clock[0]
+
+    # roles, shapes and goals
+    sender = 1 + t % 2
+    players = {}
+    shapes = rng.permutation([1, 2, 3])[:2]
+    goals = rng.choice(len(positions), 2, replace=False)
+    for role, shape, goal in zip(['sender', 'receiver'], shapes, goals):
+        angle = 0 if shape == 2 else int(rng.choice(angles))  # circles have no orientation
+        players['p%d' % (sender if role == 'sender' else 3 - sender)] = {
+            'player': sender if role == 'sender' else 3 - sender, 'role': role, 'shape': int(shape),
+            'xPos': 0, 'yPos': 0, 'angle': 0, 'state': 'outside', 'control': 'keyboard',
+            'goal': {'shape': int(shape), 'xPos': positions[goal][0], 'yPos': positions[goal][1], 'angle': angle}}
+    ps = [k for k in players if players[k]['role'] == 'sender'][0]
+    pr = [k for k in players if players[k]['role'] == 'receiver'][0]
+    sgoal, rgoal = players[ps]['goal'], players[pr]['goal']
+    records = {}
+
+    # role and token assignment
+    onset = tick(2000)
+    records['roleassignment'] = [dict(epoch='roleassignment', trial=t+1, timestamp=onset, **players)] + [
+        {'Iamplayer': i+1, 'player': ids[i], 'date': datetime.datetime.fromtimestamp(onset / 1000).isoformat() + 'Z',
+         'timestamp': onset + 50} for i in range(2)]
+    records['tokenassignment'] = [{'epoch': 'tokenassignment', 'trial': t+1, 'timestamp': tick(2400)}]
+
+    # sender: to the receiver's goal, then to its own goal
+    onset = tick(1700)
+    path = []
+    signal = rng.random() < p['sender_skill']
+    if signal:
+        path += walk((0, 0, 0), (rgoal['xPos'], rgoal['yPos'], rgoal['angle']))
+        path.append('wait')
+    here = apply((0, 0, 0), path)
+    final = (sgoal['xPos'], sgoal['yPos'], sgoal['angle'])
+    if rng.random() < p['sender_noise']:
+        final = positions[rng.integers(len(positions))] + (sgoal['angle'],)
+    path += walk(here, final)
+    records['sender'] = [{'epoch': 'sender', 'trial': t+1, 'timestamp': onset}] + \
+        move_records(players[ps], path, rgoal, tick(p['sender_plan_time']), tick, p)
+    sender_end = records['sender'][-1]['token']
+
+    # receiver: to where it decodes its goal to be
+    onset = tick(300)
+    correct = rng.random() < p['receiver_skill'] - p['level_cost'] * (level - 2)
+    if correct and signal:
+        final = (rgoal['xPos'], rgoal['yPos'], rgoal['angle'])
+    else:
+        final = positions[rng.integers(len(positions))] + (0 if rgoal['shape'] == 2 else int(rng.choice(angles)),)
+    records['receiver'] = [{'epoch': 'receiver', 'trial': t+1, 'timestamp': onset}] + \
+        move_records(players[pr], walk((0, 0, 0), final), None, tick(p['receiver_plan_time']), tick, p)
+    receiver_end = records['receiver'][-1]['token']
+
+    # feedback, scored as for real rooms
+    feedback = {'epoch': 'feedback', 'trial': t+1, 'timestamp': tick(300), 'level': level}
+    feedback[ps], feedback[pr] = sender_end, receiver_end
+    feedback['success'] = all(x == 1 for x in check_feedback(sender_end) + check_feedback(receiver_end))
+    records['feedback'] = [feedback]
+    tick(1000)
+    return records
+
+
+def walk(here, there):
+    # moves from position/angle here to there, on the grid
+    path = []
+    for axis, (neg, pos) in enumerate([('left', 'right'), ('down', 'up')]):
+        d = there[axis] - here[axis]
+        path += [pos if d > 0 else neg] * abs(d)
+    turn = (there[2] - here[2]) % 360 // 90
+    path += ['rotateright'] * turn if turn <= 2 else ['rotateleft']
+    return path
+
+
+def apply(here, path):
+    x, y, a = here
+    for m in path:
+        if m in steps:
+            x, y = x + steps[m][0], y + steps[m][1]
+        elif m == 'rotateright':
+            a = (a + 90) % 360
+        elif m == 'rotateleft':
+            a = (a - 90) % 360
+    return x, y, a
+
+
+def move_records(player, path, target, begin, tick, p):
+    # token records of a movement epoch: start, moves (pausing at 'wait') and stop
+    token = dict(player, state='in-use', xPos=0, yPos=0, angle=0, onTarget=0, numTarget=0, numMove=0)
+    records = [{'token': dict(token), 'action': 'start', 'timestamp': begin}]
+    pause = False
+    for m in path:
+        if m == 'wait':
+            pause = True
+            continue
+        token['xPos'], token['yPos'], token['angle'] = apply((token['xPos'], token['yPos'], token['angle']), [m])
+        token['numMove'] += 1
+        if target and [token['xPos'], token['yPos']] == [target['xPos'], target['yPos']]:
+            token['onTarget'] = 1
+            token['numTarget'] += 1
+        else:
+            token['onTarget'] = 0
+        records.append({'token': dict(token), 'action': m, 'timestamp': tick(p['target_time'] if pause else p['move_time'])})
+        pause = False
+    token['state'] = 'locked'
+    records.append({'token': dict(token), 'action': 'stop', 'timestamp': tick(p['move_time'])})
+    return records
+
+
+def simulate_tcg_cohort(nrooms, seed=None, workers=None, out_dir=None, cohort='SIM', **options):
+    # one child seed per room
+    seeds = np.random.SeedSequence(seed).spawn(nrooms)
+    names = ['sim%06d' % (i+1) for i in range(nrooms)]
+    if out_dir:
+        options.update(columnar=True, compact=True)
+
+    if workers == 1:
+        results = [simulate_room(s, n, out_dir, cohort, options) for s, n in zip(seeds, names)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(simulate_room, seeds, names, [out_dir] * nrooms, [cohort] * nrooms,
+                                    [options] * nrooms, chunksize=max(1, nrooms // (8 * (workers or os.cpu_count() or 1)))))
+    return None if out_dir else results
+
+
+def simulate_room(seed, name, out_dir, cohort, options):
+    data = simulate_tcg(seed, name=name, **options)
+    if out_dir:
+        from export_tcg import write_room
+        write_room(out_dir, cohort, name, data)
+        return None
+    return data
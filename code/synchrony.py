@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+SYNCHRONY correlates the behavior of the two players of a pair,
+for all pairs of a cohort at once
+
+INPUT
+Use as: sync = block_synchrony(group_data, 'SenderPlanTime', 'SenderPlayer')
+where group_data is a list of rooms read with read_json_tcg, and the
+planning times of player 1 as sender are correlated with those of
+player 2 as sender (their k-th sender turns paired), separately for
+the known and novel trials of the game session, as in Lab3; use
+'ReceiverPlanTime' and 'ReceiverPlayer' for the receiver role
+
+The known and novel trials follow from a layout of repeating blocks,
+by default [('known', 4), ('novel', 5)], i.e. trials 0-3 are known,
+4-8 novel, 9-12 known, etc. (Lab3's known_idx and novel_idx)
+
+Use as: sync = block_synchrony(group_data, ..., nperm=5000, seed=1)
+to also build null distributions by shuffling player 2's turns
+within each room and condition, 5000 times for all rooms at once
+
+OUTPUT
+sync.condition   condition names, in order of the layout
+sync.r           rooms x conditions correlations (NaN if fewer than
+                 3 pairs of turns)
+sync.n           rooms x conditions number of pairs
+sync.null        permutations x rooms x conditions correlations
+sync.p           rooms x conditions, one-sided p-value of the observed
+                 correlation, (1 + permutations at least as large) /
+                 (1 + nperm)
+sync.group_r     conditions, mean correlation across rooms
+sync.group_p     conditions, one-sided p-value of the mean across rooms,
+                 (1 + permutations whose mean is at least as large) /
+                 (1 + nperm)
+
+Use as: sync = sliding_synchrony(group_data, 'SenderPlanTime', 'SenderPlayer', window=10)
+for correlations over windows of 10 consecutive pairs of turns across
+the session (sync.r and sync.n rooms x windows, sync.null with nperm)
+--------------------------------------------------------
+"""
+
+
+import warnings
+import numpy as np
+
+from read_json_tcg import to_columnar
+
+
+# repeating blocks of trials, as (condition, number of trials)
+layout = [('known', 4), ('novel', 5)]
+
+
+class Synchrony(object):
+    def __init__(self):
+        self.condition = []
+        self.r = None
+        self.n = None
+        self.null = None
+        self.p = None
+        self.group_r = None
+        self.group_p = None
+
+
+def block_labels(ntrials, layout=layout):
+    # condition of each trial, cycling through the layout
+    cycle = [c for c, n in layout for _ in range(n)]
+    return np.array([cycle[t % len(cycle)] for t in range(ntrials)])
+
+
+def trial_table(data, session):
+    trials = data.trial[session]
+    return trials if isinstance(trials, np.ndarray) else to_columnar(trials, data.dtype)
+
+
+def turns(group_data, value, player, session, mask=None):
+    # rooms x 2 players x turns values, in trial order (NaN padded), where
+    # mask (rooms x trials) selects the trials to include
+    tables = [trial_table(data, session) for data in group_data]
+    ntrials = max([len(t) for t in tables], default=0)
+    vals = np.full((len(tables), ntrials), np.nan)
+    who = np.zeros((len(tables), ntrials), dtype=int)
+    for r, t in enumerate(tables):
+        vals[r, :len(t)] = t[value]
+        who[r, :len(t)] = np.nan_to_num(t[player]).astype(int)
+    if mask is not None:
+        who = np.where(mask, who, 0)
+
+    # k-th turn of each player
+    out = np.full((len(tables), 2, ntrials), np.nan)
+    exists = np.zeros((len(tables), 2, ntrials), dtype=bool)
+    for p in [1, 2]:
+        mine = who == p
+        k = np.cumsum(mine, axis=1) - 1
+        rows, cols = np.nonzero(mine)
+        out[rows, p-1, k[rows, cols]] = vals[rows, cols]
+        exists[rows, p-1, k[rows, cols]] = True
+    return out, exists
+
+
+def pearson(x, y, min_n=3):
+    # correlation along the last axis, over the pairs without NaN
+    ok = ~np.isnan(x) & ~np.isnan(y)
+    n = ok.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = np.where(ok, x, 0).sum(axis=-1) / n
+        my = np.where(ok, y, 0).sum(axis=-1) / n
+        xc = np.where(ok, x - mx[..., None], 0)
+        yc = np.where(ok, y - my[..., None], 0)
+        r = (xc * yc).sum(axis=-1) / np.sqrt((xc * xc).sum(axis=-1) * (yc * yc).sum(axis=-1))
+    return np.where(n >= min_n, r, np.nan), n
+
+
+def nanmean(x, axis):
+    # mean ignoring NaN, NaN without a warning where all are NaN (e.g. windows past the shortest room)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(x, axis=axis)
+
+
+def shuffle(y, exists, rng):
+    # permute the existing entries of y along the last axis, leaving padding at the end
+    keys = np.where(exists, rng.random(y.shape), np.inf)
+    return np.take_along_axis(y, np.argsort(keys, axis=-1), axis=-1)
+
+
+def permute(x, y, exists, nperm, seed, batch=500):
+    # permutations x ... correlations, shuffling y
+    rng = np.random.default_rng(seed)
+    null = []
+    for i in range(0, nperm, batch):
+        m = min(batch, nperm - i)
+        null.append(pearson(np.broadcast_to(x, (m,) + x.shape),
+                            shuffle(np.broadcast_to(y, (m,) + y.shape), np.broadcast_to(exists, (m,) + y.shape), rng))[0])
+    return np.concatenate(null) if null else np.empty((0,) + x.shape[:-1])
+
+
+def block_synchrony(group_data, value, player, layout=layout, nperm=0, seed=None, session=2):
+    sync = Synchrony()
+    sync.condition = list(dict.fromkeys(c for c, n in layout))
+    ntrials = max([len(data.trial[session]) for data in group_data], default=0)
+    labels = block_labels(ntrials, layout)
+
+    # rooms x conditions x turns, for both players
+    x, y, exists = [], [], []
+    for c in sync.condition:
+        out, ex = turns(group_data, value, player, session, mask=(labels == c)[None])
+        x.append(out[:, 0])
+        y.append(out[:, 1])
+        exists.append(ex[:, 1])
+    x, y, exists = np.stack(x, axis=1), np.stack(y, axis=1), np.stack(exists, axis=1)
+
+    sync.r, sync.n = pearson(x, y)
+    sync.group_r = nanmean(sync.r, axis=0) if len(group_data) else np.full(len(sync.condition), np.nan)
+    if nperm:
+        sync.null = permute(x, y, exists, nperm, seed)
+        sync.p, sync.group_p = pvalues(sync.r, sync.null)
+    return sync
+
+
+def sliding_synchrony(group_data, value, player, window=10, step=1, nperm=0, seed=None, session=2):
+    sync = Synchrony()
+    out, exists = turns(group_data, value, player, session)
+    ntrn = out.shape[-1]
+    if ntrn < window:
+        out = np.pad(out, ((0, 0), (0, 0), (0, window - ntrn)), constant_values=np.nan)
+        exists = np.pad(exists, ((0, 0), (0, 0), (0, window - ntrn)))
+
+    # rooms x windows x window
+    x = np.lib.stride_tricks.sliding_window_view(out[:, 0], window, axis=-1)[:, ::step]
+    y = np.lib.stride_tricks.sliding_window_view(out[:, 1], window, axis=-1)[:, ::step]
+    sync.condition = ['window %d' % w for w in range(x.shape[1])]
+    sync.r, sync.n = pearson(x, y)
+    sync.group_r = nanmean(sync.r, axis=0) if len(group_data) else np.empty(0)
+    if nperm:
+        # shuffle player 2's turns across the session, then window
+        rng = np.random.default_rng(seed)
+        null = []
+        for i in range(0, nperm, 100):
+            m = min(100, nperm - i)
+            yp = shuffle(np.broadcast_to(out[:, 1], (m,) + out[:, 1].shape), np.broadcast_to(exists[:, 1], (m,) + out[:, 1].shape), rng)
+            yw = np.lib.stride_tricks.sliding_window_view(yp, window, axis=-1)[:, :, ::step]
+            null.append(pearson(np.broadcast_to(x, yw.shape), yw)[0])
+        sync.null = np.concatenate(null)
+        sync.p, sync.group_p = pvalues(sync.r, sync.null)
+    return sync
+
+
+def pvalues(r, null):
+    # one-sided, per room and across rooms: (1 + permutations at least as
+    # large) / (1 + permutations), such that p is never 0
+    nperm = len(null)
+    with np.errstate(invalid='ignore'):
+        p = np.where(np.isnan(r), np.nan, (np.sum(null >= r, axis=0) + 1) / (nperm + 1))
+        group = nanmean(null, axis=1)
+        group_p = (np.sum(group >= nanmean(r, axis=0), axis=0) + 1) / (nperm + 1)
+    return p, group_p
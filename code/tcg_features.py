@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+TCG_FEATURES computes movement features of communication game
+rooms from their token trajectories, for all trials at once
+
+INPUT
+Use as: features = movement_features(data)
+where data was read with read_json_tcg(room, compact=True), or
+as: features = movement_features(group_data)
+for a list of rooms, which are processed together
+
+OUTPUT
+features[s] (or features[r][s] for a list of rooms) is a numpy
+structured array with one row per trial of session s, as data.trial,
+with the columns
+
+SenderNumMoves, TargetNum, TargetTime, NonTargetTime, SenderPlanTime,
+SenderMovTime, ReceiverNumMoves, ReceiverPlanTime, ReceiverMovTime
+            as the equally named columns of data.trial (computed with
+            columnar=True), from the trajectories and epoch onsets
+SenderPathLength, ReceiverPathLength
+            distance travelled by the token (grid units)
+SenderRevisits, ReceiverRevisits
+            moves onto a position the token already occupied that trial
+SenderRotations, ReceiverRotations
+            rotateleft and rotateright moves
+SenderMoveInterval, ReceiverMoveInterval
+            mean time between a move and the record before it (ms)
+
+Movement onsets (start, or the first move for tcg kids) and the
+time-on-target state carry over between trials, and a move is timed
+from the json record before it (prev_time of the Trajectory), as in
+read_json_tcg, such that the columns are identical
+--------------------------------------------------------
+"""
+
+
+import numpy as np
+
+from read_json_tcg import Trajectory, sender_moves, receiver_moves, target_field
+
+
+dtype = [('SenderNumMoves', 'i4'), ('TargetNum', 'i4'), ('TargetTime', 'f8'), ('NonTargetTime', 'f8'),
+         ('SenderPlanTime', 'f8'), ('SenderMovTime', 'f8'),
+         ('ReceiverNumMoves', 'i4'), ('ReceiverPlanTime', 'f8'), ('ReceiverMovTime', 'f8'),
+         ('SenderPathLength', 'f8'), ('SenderRevisits', 'i4'), ('SenderRotations', 'i4'), ('SenderMoveInterval', 'f8'),
+         ('ReceiverPathLength', 'f8'), ('ReceiverRevisits', 'i4'), ('ReceiverRotations', 'i4'), ('ReceiverMoveInterval', 'f8')]
+
+
+def movement_features(group_data):
+    single = not isinstance(group_data, (list, tuple))
+    if single:
+        group_data = [group_data]
+
+    # all sessions of all rooms back to back, one segment per session
+    segments, onsets, targets, rooms = [], {'sender': [], 'receiver': []}, [], []
+    for r, data in enumerate(group_data):
+        for sidx in range(len(data.trial)):
+            sender, receiver = data.token_sender[sidx], data.token_receiver[sidx]
+            if not isinstance(sender, Trajectory):  # the per-row meta is only kept with compact=True
+                raise ValueError('movement_features requires rooms read with compact=True')
+            segments.append((sender, receiver))
+            for role in onsets:
+                onsets[role] += [e[p.index(role)] if role in p else np.nan
+                                 for e, p in zip(data.event[sidx], data.epoch[sidx])]
+            targets += receiver.target
+            rooms += [r] * len(receiver)
+    ntrials = [len(s[1]) for s in segments]
+    rooms = np.array(rooms, dtype=int)
+
+    # the receiver's goal position (tcg)
+    tx, ty = np.full(len(targets), np.nan), np.full(len(targets), np.nan)
+    for t, target in enumerate(targets):
+        if isinstance(target, list):
+            tx[t], ty[t] = target[:2]
+
+    sender = role_rows([s[0] for s in segments], rooms, sender_moves)
+    receiver = role_rows([s[1] for s in segments], rooms, receiver_moves)
+
+    # sender on target: at the receiver's goal position (tcg) or at the field
+    # of its token's goal (tcg kids)
+    t = sender['trial']
+    field = np.asarray(target_field)[np.clip(sender['goal'] - 1, 0, len(target_field) - 1)]
+    on = np.where(sender['kids'],
+                  (sender['goal'] > 0) & (sender['x'] == field[:, 0]) & (sender['y'] == field[:, 1]),
+                  sender['numeric'] & (sender['x'] == tx[t]) & (sender['y'] == ty[t]))
+    on &= sender['move']
+
+    # time after a move onto the target (until the next move) vs elsewhere
+    waits = sender['move'] | sender['onset']
+    last = carry(np.flatnonzero(waits), sender['row'], sender['room'], exclude_self=True)
+    wait = np.where(last >= 0, on[np.maximum(last, 0)], False) & ~sender['first kids']
+    dt = sender['dt']
+    target = sender['move'] & wait
+    other = sender['move'] & ~wait
+
+    features = np.zeros(len(targets), dtype=dtype)
+    features['SenderNumMoves'] = per_trial(sender['move'], sender['offset'])
+    features['TargetNum'] = per_trial(on, sender['offset'])
+    features['TargetTime'] = mean_per_trial(dt, target, sender['offset'])
+    features['NonTargetTime'] = mean_per_trial(dt, other, sender['offset'])
+    for role, rows in [('Sender', sender), ('Receiver', receiver)]:
+        plan, mov = epoch_times(rows, np.array(onsets[role.lower()], dtype=float))
+        dt = rows['dt']
+        features[role + 'NumMoves'] = per_trial(rows['move'], rows['offset'])
+        features[role + 'PlanTime'] = plan
+        features[role + 'MovTime'] = mov
+        features[role + 'PathLength'] = per_trial(rows['step'], rows['offset'])
+        features[role + 'Revisits'] = per_trial(rows['revisit'], rows['offset'])
+        features[role + 'Rotations'] = per_trial(rows['rotation'], rows['offset'])
+        features[role + 'MoveInterval'] = mean_per_trial(dt, rows['move'], rows['offset'])
+
+    # back to rooms and sessions
+    out, i, k = [], 0, 0
+    for data in group_data:
+        out.append([])
+        for sidx in range(len(data.trial)):
+            out[-1].append(features[i:i+ntrials[k]])
+            i, k = i + ntrials[k], k + 1
+    return out[0] if single else out
+
+
+def role_rows(trajectories, rooms, moves):
+    # token rows of all trajectories, with per-row flags
+    offset = np.cumsum([0] + [n for traj in trajectories for n in np.diff(traj.offset)])
+    ntrials = len(offset) - 1
+    rows = {'offset': offset,
+            'trial': np.repeat(np.arange(ntrials), np.diff(offset)),
+            'row': np.arange(offset[-1])}
+    rows['room'] = rooms[rows['trial']]
+    if not trajectories or not offset[-1]:
+        empty = np.zeros(0, dtype=bool)
+        rows.update(time=np.zeros(0), x=np.zeros(0), y=np.zeros(0), move=empty, onset=empty, stop=empty,
+                    kids=empty, numeric=empty, step=np.zeros(0), revisit=empty, rotation=empty,
+                    goal=np.zeros(0, dtype=int), dt=np.zeros(0))
+        rows['first kids'] = empty
+        return rows
+
+    # values of the small-int codes, per trajectory
+    def decode(table, codes, test):
+        return np.array([test(v) for v in table], dtype=bool)[codes] if len(codes) else np.zeros(0, dtype=bool)
+    rows['time'] = np.concatenate([traj.time for traj in trajectories]).astype(float)
+    coord = np.concatenate([traj.coord[:, :2].astype(float) for traj in trajectories])
+    rows['x'], rows['y'] = coord[:, 0], coord[:, 1]
+    rows['move'] = np.concatenate([decode(traj.actions, traj.action, lambda a: a in moves) for traj in trajectories])
+    rows['onset'] = np.concatenate([decode(traj.actions, traj.action, lambda a: a == 'start') for traj in trajectories])
+    rows['stop'] = np.concatenate([decode(traj.actions, traj.action, lambda a: a in ('stop', 'timeout')) for traj in trajectories])
+    rows['rotation'] = np.concatenate([decode(traj.actions, traj.action, lambda a: a in ('rotateleft', 'rotateright')) for traj in trajectories])
+    rows['kids'] = np.concatenate([decode(traj.shapes, traj.shape, lambda s: str(s).isalpha()) for traj in trajectories])
+    rows['numeric'] = np.concatenate([decode(traj.shapes, traj.shape, lambda s: str(s).isnumeric()) for traj in trajectories])
+    rows['goal'] = np.concatenate([traj.goal for traj in trajectories]).astype(int)
+
+    # first move of a trial (tcg kids), which marks the movement onset
+    first = offset[:-1][rows['trial']]
+    nmove = np.cumsum(rows['move']) - np.append(0, np.cumsum(rows['move']))[first]
+    rows['first kids'] = rows['move'] & rows['kids'] & (nmove == 1)
+    rows['onset'] = rows['onset'] | rows['first kids']
+
+    # time since the json record before each row
+    prev = np.concatenate([traj.prev_time for traj in trajectories]).astype(float)
+    rows['dt'] = np.where(prev >= 0, rows['time'] - prev, np.nan)
+
+    # distance to the previous row, and moves onto earlier positions within the
+    # trial (not rotations in place, nor moves blocked at the edge of the grid)
+    step = np.hypot(np.diff(rows['x'], prepend=np.nan), np.diff(rows['y'], prepend=np.nan))
+    rows['step'] = np.where(rows['row'] == first, 0, step)
+    _, index = np.unique(np.column_stack([rows['trial'], rows['x'], rows['y']]), axis=0, return_index=True)
+    seen = np.ones(len(rows['row']), dtype=bool)
+    seen[index] = False
+    rows['revisit'] = seen & rows['move'] & (rows['step'] > 0)
+    return rows
+
+
+def carry(valid, row, room, exclude_self=False):
+    # per row, the last valid row before it (or at it) within the same room, -1 if none
+    mark = np.full(len(row), -1)
+    mark[valid] = valid
+    if exclude_self:
+        mark = np.append(-1, mark[:-1])[:len(row)]
+    last = np.maximum.accumulate(mark) if len(mark) else mark
+    return np.where((last >= 0) & (room[np.maximum(last, 0)] == room), last, -1)
+
+
+def epoch_times(rows, onsets):
+    # planning time (movement onset minus epoch onset) and movement time
+    # (last stop minus the movement onset before it), per trial
+    n = len(rows['offset']) - 1
+    plan, mov = np.full(n, np.nan), np.full(n, np.nan)
+    if not len(rows['row']):
+        return plan, mov
+    t = rows['trial']
+    idx = np.flatnonzero(rows['onset'])
+    last = np.full(n, -1)
+    np.maximum.at(last, t[idx], idx)
+    has = last >= 0
+    plan[has] = rows['time'][last[has]] - onsets[has]
+
+    idx = np.flatnonzero(rows['stop'])
+    stop = np.full(n, -1)
+    np.maximum.at(stop, t[idx], idx)
+    onset = carry(np.flatnonzero(rows['onset']), rows['row'], rows['room'])
+    has = stop >= 0
+    begin = onset[stop[has]]
+    mov[np.flatnonzero(has)[begin >= 0]] = rows['time'][stop[has][begin >= 0]] - rows['time'][begin[begin >= 0]]
+    return plan, mov
+
+
+def per_trial(values, offset):
+    # sum over the rows of each trial, at offset[t]:offset[t+1]
+    values = np.append(np.asarray(values, dtype=float), 0)
+    if len(offset) < 2:
+        return np.zeros(0)
+    total = np.add.reduceat(values, offset[:-1])
+    return np.where(np.diff(offset) > 0, total, 0)
+
+
+def mean_per_trial(values, mask, offset):
+    # mean over the masked rows of each trial, NaN if none
+    n = per_trial(mask, offset)
+    total = per_trial(np.where(mask, values, 0), offset)
+    return np.divide(total, n, out=np.full(len(n), np.nan), where=n > 0)
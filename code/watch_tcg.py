@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+WATCH_TCG follows live communication game rooms, reading each
+json file as it lands with the epoch readers of read_json_tcg
+
+INPUT
+Use as: python watch_tcg.py ../data/TCG_WI24
+to follow all room folders in the cohort folder, including rooms
+created later, printing the success rate and level of a room whenever
+one of its trials completes (--rooms to follow room folders instead)
+
+Use as: watcher = Watcher(rooms=['room001225'], cohorts=['../data/TCG_WI24'])
+        while True:
+            for room in watcher.poll(timeout=1):
+                trials = room.table()
+where poll waits up to timeout seconds for new files (with inotify on
+Linux, or by scanning the folders every interval seconds otherwise, or
+with inotify=False), reads them, and returns the rooms that changed;
+a single watcher follows any number of rooms, and only reads the files
+that landed since the previous poll
+
+The files of a room are read in the order of read_json_tcg (session,
+trial, epoch), holding back a file until those before it landed, such
+that the trials come out as those of read_json_tcg; an epoch without
+a file is skipped once any later file landed, and a file that cannot be
+decoded (e.g. still being written) is retried at the next poll
+
+OUTPUT
+room.data           the room read so far, as read_json_tcg(room)
+room.table(2)       structured array of the trials of the game session
+                    (as columnar=True), including the trial in progress
+room.curves(2)      trial numbers, running success rate and level, per
+                    trial of the game session
+room.finish()       reads the remaining files, skipping missing epochs,
+                    and closes the trial in progress, returning room.data
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import time
+import json
+import struct
+import select
+import argparse
+import datetime
+import numpy as np
+try:
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.inotify_init1  # Linux only
+except (ImportError, OSError, AttributeError):
+    libc = None
+
+from read_json_tcg import Data, sess, epoch, json_name, new_session, new_trial, read_epoch, trial_row, to_columnar
+
+
+# inotify events
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+
+
+class Room(object):
+    # read_json_tcg of one room, one file at a time
+    def __init__(self, logfile):
+        self.logfile = logfile
+        self.data = Data()
+        self.data.info[0] = logfile
+        for sidx in range(len(sess)):
+            new_session(self.data)
+        self.trl = {}             # trial variables, as in read_json_tcg
+        self.cursor = (0, 0, 0)   # session, trial and epoch of the next file
+        self.open = False         # whether the cursor's trial was started
+        self.pending = {}         # landed files not yet read, by (session, trial, epoch)
+        self.seen = set()
+        self.tables = [None] * len(sess)
+
+    def scan(self):
+        # every file in the folder, of which only new ones are added
+        try:
+            with os.scandir(self.logfile) as it:
+                for entry in it:
+                    self.add(entry.name)
+        except OSError:
+            print('a problem arose scanning ' + self.logfile)
+
+    def add(self, name):
+        # a file landed in the folder
+        if name in self.seen:
+            return
+        self.seen.add(name)
+        name = json_name.match(name)
+        if not name or name.group(1) not in sess or name.group(3) not in epoch:
+            return
+        key = (sess.index(name.group(1)), int(name.group(2)) - 1, epoch.index(name.group(3)))
+        if key < self.cursor:
+            print('a problem arose reading ' + name.group(0) + ', it landed after later files were read')
+        else:
+            self.pending[key] = os.path.join(self.logfile, name.group(0))
+
+    def update(self, final=False):
+        # read the pending files that are next in line, returns the number read
+        nread = 0
+        while self.pending or (final and self.open):
+            s, t, e = self.cursor
+            if not self.open and not any(k[0] == s for k in self.pending):
+                if not self.pending:
+                    break
+                self.cursor = (s + 1, 0, 0)  # next session
+                continue
+            if not self.open:
+                new_trial(self.trl, self.data, s)
+                self.open = True
+
+            # the epoch's file, or skip it once later files landed
+            if self.cursor in self.pending:
+                if self.read(*self.cursor):
+                    nread += 1
+                elif not final:
+                    break  # retry at the next update
+                else:
+                    print('a problem arose reading ' + self.pending[self.cursor])
+                del self.pending[self.cursor]
+
+            # store the trial after its last epoch
+            if e + 1 < len(epoch):
+                self.cursor = (s, t, e + 1)
+            else:
+                self.data.trial[s].append(trial_row(self.trl, self.data, s, t))
+                self.cursor = (s, t + 1, 0)
+                self.open = False
+        return nread
+
+    def read(self, s, t, e):
+        try:
+            with open(self.pending[(s, t, e)]) as file:
+                val = iter(json.load(file))
+            first = next(val)
+        except (OSError, ValueError, StopIteration):
+            return False
+        read_epoch(self.trl, first, val, self.data, s, t, epoch[e])
+        return True
+
+    def finish(self):
+        self.scan()
+        self.update(final=True)
+        self.data.info[1] = datetime.datetime.fromtimestamp(
+            os.stat(self.logfile).st_mtime).strftime('%Y-%m-%d-%H:%M')
+        return self.data
+
+    def table(self, session=2):
+        # completed trials (converted once), plus the trial in progress
+        trials = self.data.trial[session]
+        done = self.tables[session]
+        if done is None or len(done) < len(trials):
+            new = to_columnar(trials[0 if done is None else len(done):], self.data.dtype)
+            self.tables[session] = new if done is None else np.concatenate([done, new])
+        table = self.tables[session]
+        if self.open and self.cursor[0] == session:
+            row = trial_row(self.trl, self.data, session, self.cursor[1])
+            table = np.concatenate([table, to_columnar([row], self.data.dtype)])
+        return table
+
+    def curves(self, session=2):
+        table = self.table(session)
+        success = table['Success'].astype(float)
+        n = np.cumsum(~np.isnan(success))
+        rate = np.cumsum(np.nan_to_num(success)) / np.maximum(n, 1)
+        return table['TrialNr'], np.where(n > 0, rate, np.nan), table['Level']
+
+
+class Watcher(object):
+    # any number of rooms, followed from one process
+    def __init__(self, rooms=(), cohorts=(), interval=1., inotify=True):
+        self.rooms = {}
+        self.cohorts = []
+        self.interval = interval
+        self.last = 0.
+        self.fd = None
+        self.watches = {}  # watch descriptor to folder
+        if inotify and libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+        for d in cohorts:
+            self.add_cohort(d)
+        for d in rooms:
+            self.add_room(d)
+
+    def watch(self, folder, mask):
+        if self.fd is None:
+            return
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+        if wd >= 0:
+            self.watches[wd] = folder
+        else:
+            print('a problem arose watching ' + folder + ', ' + os.strerror(ctypes.get_errno()))
+
+    def add_room(self, folder):
+        if folder in self.rooms:
+            return self.rooms[folder]
+        room = Room(folder)
+        self.rooms[folder] = room
+        self.watch(folder, IN_CLOSE_WRITE | IN_MOVED_TO)
+        room.scan()  # after watching, so no file is missed
+        room.update()
+        return room
+
+    def add_cohort(self, folder):
+        # room folders in the folder, now and later
+        self.cohorts.append(folder)
+        self.watch(folder, IN_CREATE | IN_MOVED_TO)
+        for d in sorted(os.listdir(folder)):
+            if os.path.isdir(os.path.join(folder, d)):
+                self.add_room(os.path.join(folder, d))
+
+    def poll(self, timeout=None):
+        # wait for new files, read them, and return the rooms that changed
+        touched, added = set(), set()
+        if self.fd is not None:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+            buf = b''
+            while ready:
+                try:
+                    chunk = os.read(self.fd, 65536)
+                except BlockingIOError:
+                    break
+                if not chunk:
+                    break
+                buf += chunk
+            i = 0
+            while i + 16 <= len(buf):
+                wd, mask, cookie, size = struct.unpack_from('iIII', buf, i)
+                name = os.fsdecode(buf[i+16:i+16+size].rstrip(b'\0'))
+                i += 16 + size
+                folder = self.watches.get(wd)
+                if mask & IN_Q_OVERFLOW:  # events were lost, including those of new rooms
+                    added |= self.scan_cohorts()
+                    for room in self.rooms.values():
+                        room.scan()
+                    touched.update(self.rooms)
+                elif folder in self.cohorts:
+                    if mask & IN_ISDIR and os.path.join(folder, name) not in self.rooms:
+                        self.add_room(os.path.join(folder, name))
+                        added.add(os.path.join(folder, name))
+                elif folder in self.rooms:
+                    self.rooms[folder].add(name)
+                    touched.add(folder)
+        else:
+            wait = self.last + self.interval - time.monotonic()
+            if timeout is not None:
+                wait = min(wait, timeout)
+            if wait > 0:
+                time.sleep(wait)
+            if time.monotonic() >= self.last + self.interval:
+                self.last = time.monotonic()
+                added = self.scan_cohorts()
+                for room in self.rooms.values():
+                    room.scan()
+
+        # read what landed, and retry files that could not be decoded before
+        touched.update(f for f, room in self.rooms.items() if room.pending)
+        changed = []
+        for folder in sorted(touched | added):
+            room = self.rooms[folder]
+            if room.update() or folder in added:
+                changed.append(room)
+        return changed
+
+    def scan_cohorts(self):
+        # room folders added to the cohort folders, returns their paths
+        added = set()
+        for folder in self.cohorts:
+            for d in sorted(os.listdir(folder)):
+                if os.path.isdir(os.path.join(folder, d)) and os.path.join(folder, d) not in self.rooms:
+                    self.add_room(os.path.join(folder, d))
+                    added.add(os.path.join(folder, d))
+        return added
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Follow live TCG rooms, reading each json file as it lands')
+    parser.add_argument('dirs', nargs='+', help='cohort folders containing the room folders')
+    parser.add_argument('--rooms', action='store_true', help='the folders are room folders instead')
+    parser.add_argument('--session', type=int, default=2, help='session to report (default: 2, game)')
+    parser.add_argument('--interval', type=float, default=1., help='seconds between scans when polling (default: 1)')
+    parser.add_argument('--poll', action='store_true', help='scan the folders instead of using inotify')
+    args = parser.parse_args(argv)
+    watcher = Watcher(rooms=args.dirs if args.rooms else (), cohorts=() if args.rooms else args.dirs,
+                      interval=args.interval, inotify=not args.poll)
+    reported = {}
+    changed = list(watcher.rooms.values())  # as read so far
+    try:
+        while True:
+            for room in changed:
+                trials, rate, level = room.curves(args.session)
+                done = len(room.data.trial[args.session])
+                if done and reported.get(room.logfile) != done:
+                    reported[room.logfile] = done
+                    print('%s %s trial %d: success %.2f, level %s' % (
+                        os.path.basename(room.logfile), sess[args.session], trials[done-1], rate[done-1], level[done-1]),
+                        flush=True)
+            changed = watcher.poll(timeout=args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
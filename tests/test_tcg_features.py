@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+--------------------------------------------------------
+TEST_TCG_FEATURES checks that movement_features recomputes the
+movement columns of read_json_tcg, for every bundled TCG room
+
+Use as: python -m pytest tests
+--------------------------------------------------------
+"""
+
+
+import os
+import sys
+import glob
+import numpy as np
+import pytest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', 'code'))
+
+from read_json_tcg import Data, Trajectory, read_json_tcg
+from tcg_features import movement_features
+
+
+columns = ['SenderNumMoves', 'TargetNum', 'TargetTime', 'NonTargetTime', 'SenderPlanTime',
+           'SenderMovTime', 'ReceiverNumMoves', 'ReceiverPlanTime', 'ReceiverMovTime']
+rooms = sorted(d for d in glob.glob(os.path.join(here, '..', 'data', 'TCG*', '*')) if os.path.isdir(d))
+
+
+@pytest.mark.parametrize('room', rooms, ids=os.path.basename)
+def test_movement_features(room):
+    try:
+        data = read_json_tcg(room, columnar=True, compact=True)
+    except Exception:
+        pytest.skip('room cannot be read')
+    features = movement_features(data)
+    for s, (trial, feature) in enumerate(zip(data.trial, features)):
+        assert len(trial) == len(feature)
+        for c in columns:
+            assert np.isclose(trial[c].astype(float), feature[c].astype(float), equal_nan=True).all(), (s, c)
+
+
+def test_hand_built_trajectory():
+    # one tcg trial: a start, a move right, a move blocked at the edge of the
+    # grid, a rotation in place, a move back onto the start and a move up
+    target = [0, 1, 0]
+    rows = [[[0, 0, 0], 1000, 1, 'p1', 'start', target],
+            [[1, 0, 0], 1200, 1, 'p1', 'right', target],
+            [[1, 0, 0], 1500, 1, 'p1', 'right', target],
+            [[1, 0, 90], 1600, 1, 'p1', 'rotateright', target],
+            [[0, 0, 90], 2000, 1, 'p1', 'left', target],
+            [[0, 1, 90], 2100, 1, 'p1', 'up', target],
+            [[0, 1, 90], 2300, 1, 'p1', 'stop', target]]
+    meta = [(900, 0), (1000, 0), (1200, 0), (1500, 0), (1600, 0), (2050, 0), (2100, 0)]  # a record without token at 2050
+    data = Data()
+    data.trial = [[None]]
+    data.event, data.epoch = [[[900]]], [[['sender']]]
+    data.token_sender = [Trajectory([rows], [meta])]
+    data.token_receiver = [Trajectory([[]], [[]])]
+
+    features = movement_features(data)[0]
+    assert features['SenderNumMoves'][0] == 5
+    assert features['SenderPathLength'][0] == 3
+    assert features['SenderRevisits'][0] == 1  # back onto the start, not the blocked move
+    assert features['SenderRotations'][0] == 1
+    assert features['SenderMoveInterval'][0] == (200 + 300 + 100 + 400 + 50) / 5
+    assert features['SenderPlanTime'][0] == 100
+    assert features['SenderMovTime'][0] == 1300
+    assert features['ReceiverPathLength'][0] == 0 and features['ReceiverRevisits'][0] == 0
+    assert features['ReceiverRotations'][0] == 0 and np.isnan(features['ReceiverMoveInterval'][0])